@@ -62,6 +62,18 @@ def hash_to_hex_str(x):
     return bytes(reversed(x)).hex()
 
 
+def hashes_to_hex_strs(hashes):
+    '''Convert an iterable of 32-byte big-endian binary hashes to a list of displayed hex
+    strings.
+
+    Equivalent to mapping hash_to_hex_str over hashes, but reverses and hex-encodes them all
+    in a single pass.
+    '''
+    # Reversing the concatenation reverses each hash and also their order
+    hex_str = b''.join(hashes)[::-1].hex()
+    return [hex_str[n: n + 64] for n in range(len(hex_str) - 64, -1, -64)]
+
+
 def hex_str_to_hash(x):
     '''Convert a displayed hex string to a binary hash.'''
     return bytes(reversed(hex_to_bytes(x)))
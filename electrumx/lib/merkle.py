@@ -123,6 +123,52 @@ class Merkle(object):
             raise ValueError('index out of range for branch')
         return hash_
 
+    def layers(self, flat_hashes):
+        '''Return all the layers of the merkle tree of flat_hashes, a non-empty concatenation
+        of 32-byte binary hashes.
+
+        The result is a list of layers from the leaves (flat_hashes itself) up to the root,
+        each one a concatenation of hashes.  Layers are stored before the final hash of an
+        odd-length layer is repeated.
+        '''
+        if not isinstance(flat_hashes, bytes):
+            raise TypeError('flat_hashes must be bytes')
+        if not flat_hashes or len(flat_hashes) % 32:
+            raise ValueError('flat_hashes must be a non-empty concatenation of hashes')
+        hash_func = self.hash_func
+        layer = flat_hashes
+        layers = [layer]
+        while len(layer) > 32:
+            # An odd hash count; repeat the final hash
+            if len(layer) & 32:
+                layer += layer[-32:]
+            layer = b''.join([hash_func(layer[n: n + 64]) for n in range(0, len(layer), 64)])
+            layers.append(layer)
+        return layers
+
+    def branch_and_root_from_layers(self, layers, index, tsc_format=False):
+        '''Return a (merkle branch, merkle_root) pair given the layers of a merkle tree as
+        returned by layers(), and the index of one of its leaf hashes.
+
+        No hashing is needed.
+        '''
+        if not isinstance(index, int):
+            raise TypeError('index must be an integer')
+        if not 0 <= index < len(layers[0]) // 32:
+            raise ValueError('index out of range')
+        branch = []
+        for layer in layers[:-1]:
+            start = (index ^ 1) * 32
+            if start < len(layer):
+                branch.append(layer[start: start + 32])
+            elif tsc_format:
+                # Asterix used in place of "duplicated" hashes in TSC format
+                branch.append(b"*")
+            else:
+                branch.append(layer[index * 32: index * 32 + 32])
+            index >>= 1
+        return branch, layers[-1]
+
     def level(self, hashes, depth_higher):
         '''Return a level of the merkle tree of hashes the given depth
         higher than the bottom row of the original tree.'''
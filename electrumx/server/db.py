@@ -839,8 +839,8 @@ class DB:
             tx_hash = self.hashes_file.read(tx_num * 32, 32)
         return tx_hash, tx_height
 
-    def fs_tx_hashes_at_blockheight(self, block_height):
-        '''Return a list of tx_hashes at given block height,
+    def fs_flat_tx_hashes_at_blockheight(self, block_height):
+        '''Return the concatenated 32-byte tx_hashes at given block height,
         in the same order as in the block.
         '''
         if block_height > self.state.height:
@@ -853,10 +853,10 @@ class DB:
         num_txs_in_block = self.tx_counts[block_height] - first_tx_num
         tx_hashes = self.hashes_file.read(first_tx_num * 32, num_txs_in_block * 32)
         assert num_txs_in_block == len(tx_hashes) // 32
-        return [tx_hashes[idx * 32: (idx+1) * 32] for idx in range(num_txs_in_block)]
+        return tx_hashes
 
-    async def tx_hashes_at_blockheight(self, block_height):
-        return await run_in_thread(self.fs_tx_hashes_at_blockheight, block_height)
+    async def flat_tx_hashes_at_blockheight(self, block_height):
+        return await run_in_thread(self.fs_flat_tx_hashes_at_blockheight, block_height)
 
     async def fs_block_hashes(self, height, count):
         headers_concat, headers_count = await self.read_headers(height, count)
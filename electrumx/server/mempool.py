@@ -453,49 +453,59 @@ class MemPool(object):
         for tx_hash in set(txs).difference(all_hashes):
             tx = txs.pop(tx_hash)
 
+            # Everything the tx created or changed is touched by its removal, as it was by
+            # its arrival
             reissued_assets = tx_to_reissue.pop(tx_hash, set())
             for reissued_asset in reissued_assets:
                 reissues.pop(reissued_asset, None)
+            assets_touched.update(reissued_assets)
 
             created_assets = tx_to_create.pop(tx_hash, set())
             for created_asset in created_assets:
                 creates.pop(created_asset, None)
+            assets_touched.update(created_assets)
 
             quals = tx_to_qualifier_tags.pop(tx_hash, set())
             for qual in quals:
                 qualifier_tags[qual].pop(tx_hash, None)
                 if not qualifier_tags[qual]:
                     qualifier_tags.pop(qual, None)
+            tag_qualifiers_touched.update(quals)
 
             h160s = tx_to_h160_tags.pop(tx_hash, set())
             for h160 in h160s:
                 h160_tags[h160].pop(tx_hash, None)
                 if not h160_tags[h160]:
                     h160_tags.pop(h160, None)
+            tag_h160_touched.update(h160s)
 
             broadcast = tx_to_broadcast.pop(tx_hash, set())
             for b in broadcast:
                 broadcasts[b].pop(tx_hash, None)
                 if not broadcasts[b]:
                     broadcasts.pop(b, None)
+            broadcasts_asset_touched.update(broadcast)
 
             freeze = tx_to_freeze.pop(tx_hash, set())
             for f in freeze:
                 freezes[f].pop(tx_hash, None)
                 if not freezes[f]:
                     freezes.pop(f, None)
+            freezes_asset_touched.update(freeze)
 
             verifier = tx_to_verifier.pop(tx_hash, set())
             for v in verifier:
                 verifiers[v].pop(tx_hash, None)
                 if not verifiers[v]:
                     verifiers.pop(v, None)
+            verifier_string_asset_touched.update(verifier)
 
             qualifier_association = tx_to_qualifier_associations.pop(tx_hash, set())
             for qa in qualifier_association:
                 qualifier_associations[qa].pop(tx_hash)
                 if not qualifier_associations[qa]:
                     qualifier_associations.pop(qa, None)
+            restricted_qualifier_touched.update(qualifier_association)
 
             tx_hashXs = set(hashX for hashX, value, _ in tx.in_pairs)
             tx_hashXs.update(hashX for hashX, value, _ in tx.out_pairs)
@@ -818,20 +828,22 @@ class MemPool(object):
         def is_asset_valid(db_asset):
             if asset is None or asset is False: return db_asset is None
             elif asset is True: return True
-            if isinstance(asset, Iterable):
-                return db_asset in asset
-            return db_asset == asset
+            # A str is Iterable too; match it exactly rather than as a substring
+            if isinstance(asset, str):
+                return db_asset == asset
+            return db_asset in asset
         
         value = defaultdict(int)
         if hashX in self.hashXs:
             for hash_ in self.hashXs[hashX]:
                 tx = self.txs[hash_]
-                for h168, v, asset in tx.in_pairs:
-                    if h168 == hashX and is_asset_valid(asset):
-                        value[asset] -= v
-                for h168, v, asset in tx.out_pairs:
-                    if h168 == hashX and is_asset_valid(asset):
-                        value[asset] += v
+                # Don't rebind asset; is_asset_valid() filters on it
+                for h168, v, pair_asset in tx.in_pairs:
+                    if h168 == hashX and is_asset_valid(pair_asset):
+                        value[pair_asset] -= v
+                for h168, v, pair_asset in tx.out_pairs:
+                    if h168 == hashX and is_asset_valid(pair_asset):
+                        value[pair_asset] += v
         return value
 
     async def compact_fee_histogram(self):
@@ -871,16 +883,17 @@ class MemPool(object):
         def is_asset_valid(db_asset):
             if asset is None or asset is False: return db_asset is None
             elif asset is True: return True
-            if isinstance(asset, Iterable):
-                return db_asset in asset
-            return db_asset == asset
+            # A str is Iterable too; match it exactly rather than as a substring
+            if isinstance(asset, str):
+                return db_asset == asset
+            return db_asset in asset
 
         utxos = []
         for tx_hash in self.hashXs.get(hashX, ()):
             tx = self.txs.get(tx_hash)
-            for pos, (hX, value, asset) in enumerate(tx.out_pairs):
-                if hX == hashX and is_asset_valid(asset):
-                    utxos.append(UTXO(-1, pos, tx_hash, 0, asset, value))
+            for pos, (hX, value, pair_asset) in enumerate(tx.out_pairs):
+                if hX == hashX and is_asset_valid(pair_asset):
+                    utxos.append(UTXO(-1, pos, tx_hash, 0, pair_asset, value))
         return utxos
 
     async def get_asset_creation_if_any(self, asset: str):
@@ -900,7 +913,7 @@ class MemPool(object):
             }
         return ret
     
-    async def get_h160_tags(self, h160: str):
+    async def get_h160_tags(self, h160: bytes):
         ret = {}
         for txid, (asset, tx_pos, flag) in self.h160_tags.get(h160, dict()).items():
             ret[asset] = {
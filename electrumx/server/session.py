@@ -8,36 +8,45 @@
 '''Classes for local RPC server and remote client TCP/SSL servers.'''
 import asyncio
 import codecs
+import hashlib
 import itertools
 import json
 import math
 import os
 import ssl
+import sys
 import time
 import re
 from typing import Iterable, Dict, Optional, TYPE_CHECKING
 from collections import defaultdict
 from functools import partial
 from ipaddress import IPv4Address, IPv6Address
+from operator import itemgetter
+from types import MappingProxyType, MethodType
 
 import attr
 import pylru
-from aiorpcx import (Event, JSONRPCAutoDetect, JSONRPCConnection,
-                     ReplyAndDisconnect, Request, RPCError, RPCSession,
-                     handler_invocation, serve_rs, serve_ws, sleep,
+from aiorpcx import (Event, JSONRPCAutoDetect, JSONRPCConnection, JSONRPCLoose, JSONRPCv1,
+                     JSONRPCv2, ProtocolError, ReplyAndDisconnect, Request, RPCError,
+                     RPCSession, handler_invocation, serve_rs, serve_ws, sleep,
                      NewlineFramer, TaskGroup)
+from aiorpcx.util import signature_info
 
 import electrumx
 
-from electrumx.lib.merkle import MerkleCache
 from electrumx.lib.text import sessions_lines
 from electrumx.lib import util
-from electrumx.lib.hash import (sha256, hash_to_hex_str, hex_str_to_hash, HASHX_LEN, Base58Error,
-                                double_sha256)
+from electrumx.lib.hash import (hash_to_hex_str, hashes_to_hex_strs, hex_str_to_hash, HASHX_LEN,
+                                Base58Error, double_sha256)
 
 from electrumx.server.daemon import DaemonError
 from electrumx.server.peers import PeerManager
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 if TYPE_CHECKING:
     from electrumx.server.db import DB
     from electrumx.server.mempool import MemPool
@@ -46,6 +55,24 @@ if TYPE_CHECKING:
 BAD_REQUEST = 1
 DAEMON_ERROR = 2
 
+# The most script hashes a blockchain.scripthashes.* request may query
+MAX_SCRIPTHASH_BATCH = 100
+
+# Seconds the daemon's getnetworkinfo result is shared between requests for
+NETWORK_INFO_TTL = 5.0
+
+# The variables substituted into banners
+BANNER_VARIABLES_RE = re.compile(
+    r'\$(?:SERVER_VERSION|SERVER_SUBVERSION|DAEMON_VERSION|DAEMON_SUBVERSION|DONATION_ADDRESS)')
+
+# The asset names in a restricted asset's verifier string
+VERIFIER_ASSETS_RE = re.compile(r'([A-Z0-9_.]+)')
+
+# ElectrumX session attributes holding asset and tag subscriptions, in the order their
+# touched sets are passed to notify()
+ASSET_SUB_KINDS = ('asset_subs', 'qualifier_tag_subs', 'h160_tag_subs', 'broadcast_subs',
+                   'frozen_subs', 'validator_subs', 'qualifier_validator_subs')
+
 
 def scripthash_to_hashX(scripthash):
     try:
@@ -100,6 +127,108 @@ def assert_raw_bytes(value):
     raise RPCError(BAD_REQUEST, f'argument should be hex-encoded bytes')
 
 
+def address_status_bytes(tx_hashes, heights):
+    '''Return the encoded address status string of the given tx hashes and their heights,
+    built in a single join.'''
+    return ''.join(f'{tx_hash_str}:{height:d}:' for tx_hash_str, height
+                   in zip(hashes_to_hex_strs(tx_hashes), heights)).encode()
+
+
+class OrjsonMixin:
+    '''Encodes and decodes the JSON of an aiorpcx JSON RPC protocol with orjson rather than
+    the standard library.'''
+
+    @classmethod
+    def _message_to_payload(cls, message):
+        try:
+            return orjson.loads(message)
+        except orjson.JSONDecodeError:
+            raise cls._error(cls.PARSE_ERROR, 'invalid JSON', True, None) from None
+
+    @classmethod
+    def encode_payload(cls, payload):
+        try:
+            return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            msg = f'JSON payload encoding error: {payload}'
+            raise ProtocolError(cls.INTERNAL_ERROR, msg) from None
+
+
+class OrjsonRPCv1(OrjsonMixin, JSONRPCv1):
+    pass
+
+
+class OrjsonRPCv2(OrjsonMixin, JSONRPCv2):
+    pass
+
+
+class OrjsonRPCLoose(OrjsonMixin, JSONRPCLoose):
+    pass
+
+
+class OrjsonRPCAutoDetect(OrjsonMixin, JSONRPCAutoDetect):
+
+    protocols = {JSONRPCv1: OrjsonRPCv1, JSONRPCv2: OrjsonRPCv2, JSONRPCLoose: OrjsonRPCLoose}
+
+    @classmethod
+    def detect_protocol(cls, message):
+        return cls.protocols[super().detect_protocol(message)]
+
+
+class OrjsonRPCConnection(JSONRPCConnection):
+    '''A JSONRPCConnection using orjson for its JSON.'''
+
+    def __init__(self):
+        super().__init__(OrjsonRPCAutoDetect)
+
+    def receive_message(self, message):
+        # JSONRPCConnection only auto-detects for its own auto-detect protocol
+        if self._protocol is OrjsonRPCAutoDetect:
+            self._protocol = OrjsonRPCAutoDetect.detect_protocol(message)
+        return super().receive_message(message)
+
+
+class BufferedNewlineFramer(NewlineFramer):
+    '''A NewlineFramer that tracks its position in a received chunk holding several messages,
+    rather than copying the remainder of the chunk each time it frames one.'''
+
+    def __init__(self, max_size=250 * 4000):
+        super().__init__(max_size)
+        self.residual_pos = 0
+
+    async def receive_message(self):
+        parts = []
+        buffer_size = 0
+        while True:
+            part, start = self.residual, self.residual_pos
+            if start >= len(part):
+                part, start = await self.queue.get(), 0
+                if self.exception:
+                    raise self.exception
+
+            npos = part.find(b'\n', start)
+            if npos == -1:
+                self.residual, self.residual_pos = b'', 0
+                part = part[start:]
+                parts.append(part)
+                buffer_size += len(part)
+                # Ignore over-sized messages; re-synchronize
+                if buffer_size <= self.max_size or self.max_size == 0:
+                    continue
+                self.synchronizing = True
+                raise MemoryError(f'dropping message over {self.max_size:,d} '
+                                  f'bytes and re-synchronizing')
+
+            self.residual, self.residual_pos = part, npos + 1
+            if self.synchronizing:
+                self.synchronizing = False
+                parts = []
+                buffer_size = 0
+                continue
+            parts.append(part[start:npos])
+            return b''.join(parts)
+
+
 @attr.s(slots=True)
 class SessionGroup:
     name = attr.ib()
@@ -123,6 +252,58 @@ class SessionReferences:
     unknown = attr.ib()     # Strings
 
 
+class TxHashes:
+    '''The ordered binary tx hashes of a block, held as a single flat bytes object rather
+    than a list of 32-byte objects.  Supports the list operations callers need.'''
+
+    __slots__ = ('flat', 'hex_flat', 'positions')
+
+    def __init__(self, flat):
+        self.flat = flat
+        # Hex of all the hashes reversed, and a map of hash to position; built on first use
+        self.hex_flat = None
+        self.positions = None
+
+    def __len__(self):
+        return len(self.flat) // 32
+
+    def __iter__(self):
+        flat = self.flat
+        return (flat[n: n + 32] for n in range(0, len(flat), 32))
+
+    def __getitem__(self, index):
+        flat = self.flat
+        if isinstance(index, slice):
+            return [flat[n * 32: n * 32 + 32] for n in range(*index.indices(len(self)))]
+        count = len(self)
+        if index < 0:
+            index += count
+        if not 0 <= index < count:
+            raise IndexError('tx hash index out of range')
+        return flat[index * 32: index * 32 + 32]
+
+    def index(self, tx_hash):
+        '''Return the position of tx_hash.  Raises ValueError if it is not present.'''
+        positions = self.positions
+        if positions is None:
+            positions = self.positions = {tx_hash: pos for pos, tx_hash in enumerate(self)}
+        try:
+            return positions[tx_hash]
+        except (KeyError, TypeError):
+            raise ValueError('tx hash not in block') from None
+
+    def hex_str(self, index):
+        '''Return the hash at position index as a display hex string.  Raises IndexError.'''
+        count = len(self)
+        if not 0 <= index < count:
+            raise IndexError('tx hash index out of range')
+        hex_flat = self.hex_flat
+        if hex_flat is None:
+            hex_flat = self.hex_flat = self.flat[::-1].hex()
+        start = (count - 1 - index) * 64
+        return hex_flat[start: start + 64]
+
+
 class SessionManager:
     '''Holds global state about all sessions.'''
 
@@ -147,14 +328,28 @@ class SessionManager:
         self._history_cache = pylru.lrucache(1000)
         self._history_lookups = 0
         self._history_hits = 0
+        # hashX -> (history length, last history entry, status length, SHA-256 state,
+        #           reorg count) of the confirmed part of address statuses
+        self._status_cache = pylru.lrucache(1000)
         self._tx_hashes_cache = pylru.lrucache(1000)
         self._tx_hashes_lookups = 0
         self._tx_hashes_hits = 0
-        # Really a MerkleCache cache
+        # Block height -> merkle tree layers of its tx hashes
         self._merkle_cache = pylru.lrucache(1000)
         self._merkle_lookups = 0
         self._merkle_hits = 0
+        # (cp_height, height) -> (branch, root) hex strings of a header merkle proof
+        self._header_proof_cache = pylru.lrucache(1000)
         self.estimatefee_cache = pylru.lrucache(1000)
+        # Banner file path -> (modification time, contents)
+        self._banner_cache = {}
+        # (fetch time, fetch task) of the daemon's getnetworkinfo result
+        self._network_info = None
+        # (subscription kind, key) -> status task of asset and tag subscriptions, shared by
+        # sessions.  Entries are dropped when their key is touched.
+        self._shared_status_cache = pylru.lrucache(10000)
+        # Inverted indices of asset and tag subscriptions: kind -> key -> sessions
+        self._sub_indices = {kind: defaultdict(set) for kind in ASSET_SUB_KINDS}
         self.notified_height = None
         self.hsub_results = None
         self._sslc = None
@@ -165,8 +360,8 @@ class SessionManager:
         # Set up the RPC request handlers
         cmds = ('add_peer daemon_url disconnect getinfo groups log peers '
                 'query reorg sessions stop'.split())
-        self.rpc_request_handlers = {cmd: getattr(self, 'rpc_' + cmd)
-                                     for cmd in cmds}
+        self.rpc_request_handlers = MappingProxyType({sys.intern(cmd): getattr(self, 'rpc_' + cmd)
+                                                      for cmd in cmds})
 
     def _ssl_context(self):
         if self._sslc is None:
@@ -277,8 +472,13 @@ class SessionManager:
             await self.bp.backed_up_event.wait()
             self.logger.info('reorg signalled; clearing tx_hashes and merkle caches')
             self._reorg_count += 1
+            # Cached histories and status hash states may include reorged-out transactions
+            self._history_cache.clear()
+            self._status_cache.clear()
             self._tx_hashes_cache.clear()
             self._merkle_cache.clear()
+            self._header_proof_cache.clear()
+            self._shared_status_cache.clear()
 
     async def _recalc_concurrency(self):
         '''Periodically recalculate session concurrency.'''
@@ -661,24 +861,22 @@ class SessionManager:
         tx_hash_count = len(tx_hashes)
         cost = tx_hash_count
 
-        if tx_hash_count >= 200:
-            self._merkle_lookups += 1
-            merkle_cache = self._merkle_cache.get(height)
-            if merkle_cache:
-                self._merkle_hits += 1
-                cost = 10 * math.sqrt(tx_hash_count)
-            else:
-                async def tx_hashes_func(start, count):
-                    return tx_hashes[start: start + count]
-
-                merkle_cache = MerkleCache(self.db.merkle, tx_hashes_func)
-                self._merkle_cache[height] = merkle_cache
-                await merkle_cache.initialize(len(tx_hashes))
-            branch, root = await merkle_cache.branch_and_root(tx_hash_count, tx_pos,
-                                                              tsc_format=tsc_format)
+        # With the tree layers of the block cached, a branch is just a lookup of siblings
+        merkle = self.db.merkle
+        self._merkle_lookups += 1
+        layers = self._merkle_cache.get(height)
+        if layers:
+            self._merkle_hits += 1
+            # Never charge more for a cached branch than for calculating it
+            cost = min(tx_hash_count, 10 * math.sqrt(tx_hash_count))
         else:
-            branch, root = self.db.merkle.branch_and_root(tx_hashes, tx_pos,
-                                                          tsc_format=tsc_format)
+            if isinstance(tx_hashes, TxHashes):
+                flat_hashes = tx_hashes.flat
+            else:
+                flat_hashes = b''.join(tx_hashes)
+            layers = merkle.layers(flat_hashes)
+            self._merkle_cache[height] = layers
+        branch, root = merkle.branch_and_root_from_layers(layers, tx_pos, tsc_format=tsc_format)
 
         if tsc_format:
             def converter(_hash):
@@ -749,17 +947,22 @@ class SessionManager:
         tsc_proof = {}
         tx_hashes, tx_hashes_cost = await self.tx_hashes_at_blockheight(height)
         tx_pos = get_tx_position(tx_hash)
-        branch, root, merkle_cost = await self._merkle_branch(height, tx_hashes, tx_pos,
-                                                              tsc_format=True)
+        # The branch, header and transaction lookups are independent; overlap them.  Wait for
+        # all of them so that a failure doesn't leave a daemon request running unobserved.
+        results = await asyncio.gather(
+            self._merkle_branch(height, tx_hashes, tx_pos, tsc_format=True),
+            get_target(target_type), get_txid_or_tx_field(tx_hash), return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        (branch, root, merkle_cost), (target, root_from_header, header_cost), \
+            (txid_or_tx_field, tx_fetch_cost) = results
 
-        target, root_from_header, header_cost = await get_target(target_type)
         # sanity check
         if root != root_from_header:
             raise RPCError(BAD_REQUEST, 'db error. Merkle root from cached block header does not '
                                         'match the derived merkle root') from None
 
-        txid_or_tx_field, tx_fetch_cost = await get_txid_or_tx_field(tx_hash)
-
         tsc_proof['index'] = tx_pos
         tsc_proof['txid_or_tx'] = txid_or_tx_field
         tsc_proof['target'] = target
@@ -769,20 +972,58 @@ class SessionManager:
     async def merkle_branch_for_tx_pos(self, height, tx_pos):
         '''Return a triple (branch, tx_hash_hex, cost).'''
         tx_hashes, tx_hashes_cost = await self.tx_hashes_at_blockheight(height)
+        tx_hash_hex = self._tx_hash_hex(height, tx_hashes, tx_pos)
+        branch, _root, merkle_cost = await self._merkle_branch(height, tx_hashes, tx_pos)
+        return branch, tx_hash_hex, tx_hashes_cost + merkle_cost
+
+    async def tx_hash_hex(self, height, tx_pos):
+        '''Returns a pair (tx_hash_hex, cost) for the tx at position tx_pos of the block at
+        height.  The hex strings of a block's hashes are cached with its hashes.  Raises
+        RPCError.
+        '''
+        tx_hashes, cost = await self.tx_hashes_at_blockheight(height)
+        return self._tx_hash_hex(height, tx_hashes, tx_pos), cost
+
+    def _tx_hash_hex(self, height, tx_hashes, tx_pos):
         try:
-            tx_hash = tx_hashes[tx_pos]
+            return tx_hashes.hex_str(tx_pos)
         except IndexError:
             raise RPCError(
                 BAD_REQUEST, f'no tx at position {tx_pos:,d} in block at height {height:,d}'
             ) from None
-        branch, _root, merkle_cost = await self._merkle_branch(height, tx_hashes, tx_pos)
-        return branch, hash_to_hex_str(tx_hash), tx_hashes_cost + merkle_cost
+
+    def banner_file_text(self, banner_file):
+        '''Return the contents of a banner file, re-reading it only if it has been modified.
+        Raises OSError or UnicodeDecodeError.'''
+        mtime = os.stat(banner_file).st_mtime_ns
+        cached = self._banner_cache.get(banner_file)
+        if cached is None or cached[0] != mtime:
+            with codecs.open(banner_file, 'r', 'utf-8') as f:
+                cached = self._banner_cache[banner_file] = (mtime, f.read())
+        return cached[1]
+
+    async def header_merkle_proof(self, cp_height, height):
+        '''Returns a pair (branch, root) of hex strings proving the header at height is in the
+        chain up to cp_height.  As the headers are fixed once cp_height is, proofs are
+        cached until a reorg.
+        '''
+        key = (cp_height, height)
+        proof = self._header_proof_cache.get(key)
+        if proof is None:
+            while True:
+                reorg_count = self._reorg_count
+                branch, root = await self.db.header_branch_and_root(cp_height + 1, height)
+                if reorg_count == self._reorg_count:
+                    break
+            proof = (hashes_to_hex_strs(branch), hash_to_hex_str(root))
+            self._header_proof_cache[key] = proof
+        return proof
 
     async def tx_hashes_at_blockheight(self, height):
         '''Returns a pair (tx_hashes, cost).
 
-        tx_hashes is an ordered list of binary hashes, cost is an estimated cost of
-        getting the hashes; cheaper if in-cache.  Raises RPCError.
+        tx_hashes is an ordered TxHashes sequence of binary hashes, cost is an estimated
+        cost of getting the hashes; cheaper if in-cache.  Raises RPCError.
         '''
         self._tx_hashes_lookups += 1
         tx_hashes = self._tx_hashes_cache.get(height)
@@ -794,7 +1035,7 @@ class SessionManager:
         while True:
             reorg_count = self._reorg_count
             try:
-                tx_hashes = await self.db.tx_hashes_at_blockheight(height)
+                tx_hashes = TxHashes(await self.db.flat_tx_hashes_at_blockheight(height))
             except self.db.DBError as e:
                 raise RPCError(BAD_REQUEST, f'db error: {e!r}') from None
             if reorg_count == self._reorg_count:
@@ -815,6 +1056,24 @@ class SessionManager:
         except DaemonError as e:
             raise RPCError(DAEMON_ERROR, f'daemon error: {e!r}') from None
 
+    async def network_info(self):
+        '''Return the daemon's getnetworkinfo result.  Results are shared for a few seconds,
+        and concurrent requests share a single daemon request.'''
+        network_info = self._network_info
+        if network_info is None or time.monotonic() - network_info[0] > NETWORK_INFO_TTL:
+            fetch = asyncio.ensure_future(self._fetch_network_info())
+            network_info = self._network_info = (time.monotonic(), fetch)
+        return await asyncio.shield(network_info[1])
+
+    async def _fetch_network_info(self):
+        try:
+            return await self.daemon_request('getnetworkinfo')
+        except BaseException:
+            # Don't keep the failure; the next request tries again
+            if self._network_info is not None and self._network_info[1] is asyncio.current_task():
+                self._network_info = None
+            raise
+
     async def raw_header(self, height):
         '''Return the binary header at the given height.'''
         try:
@@ -841,16 +1100,46 @@ class SessionManager:
             result = self._history_cache[hashX]
             self._history_hits += 1
         except KeyError:
+            reorg_count = self._reorg_count
             result = await self.db.limited_history(hashX, limit=limit)
             cost += 0.1 + len(result) * 0.001
             if len(result) >= limit:
                 result = RPCError(BAD_REQUEST, 'history too large', cost=cost)
-            self._history_cache[hashX] = result
+            # Don't cache a history read across a reorg
+            if reorg_count == self._reorg_count:
+                self._history_cache[hashX] = result
 
         if isinstance(result, Exception):
             raise result
         return result, cost
 
+    def confirmed_status_hasher(self, hashX, db_history, reorg_count):
+        '''Returns a pair (hasher, length).
+
+        hasher is a SHA-256 object that has consumed the address status string of the
+        confirmed history db_history, and length is the length of that string.  The hash
+        state is cached per hashX so that when history is extended only the new entries are
+        hashed.  reorg_count is the reorg count from before db_history was read; the hash
+        state is only cached if there has been no reorg since.
+        '''
+        count = len(db_history)
+        entry = self._status_cache.get(hashX)
+        if (entry is not None and entry[4] == reorg_count == self._reorg_count
+                and entry[0] <= count and db_history[entry[0] - 1] == entry[1]):
+            start, _last, length, hasher, _reorg_count = entry
+            hasher = hasher.copy()
+        else:
+            start, length, hasher = 0, 0, hashlib.sha256()
+
+        if start < count:
+            suffix = address_status_bytes(*zip(*db_history[start:]))
+            hasher.update(suffix)
+            length += len(suffix)
+            if reorg_count == self._reorg_count:
+                self._status_cache[hashX] = (count, db_history[-1], length, hasher.copy(),
+                                             reorg_count)
+        return hasher, length
+
     async def _notify_sessions(self, height, touched, assets, q, h, b, f, v, qv):
         '''Notify sessions about height changes and touched addresses.'''
         height_changed = height != self.notified_height
@@ -858,23 +1147,87 @@ class SessionManager:
             await self._refresh_hsub_results(height)
             # Invalidate our history cache for touched hashXs
             cache = self._history_cache
-            for hashX in set(cache).intersection(touched):
-                del cache[hashX]
+            for hashX in touched:
+                cache.pop(hashX, None)
+
+        # Use the subscription indices to find which touched assets and tags each session
+        # is subscribed to, rather than intersecting with the subscriptions of every session
+        kind_count = len(ASSET_SUB_KINDS)
+        no_targets = (frozenset(), ) * kind_count
+        targets = {}
+        status_cache = self._shared_status_cache
+        for n, touched_keys in enumerate((assets, q, h, b, f, v, qv)):
+            kind = ASSET_SUB_KINDS[n]
+            index = self._sub_indices[kind]
+            for key in touched_keys:
+                status_cache.pop((kind, key), None)
+                for session in index.get(key, ()):
+                    session_targets = targets.get(session)
+                    if session_targets is None:
+                        session_targets = targets[session] = tuple(
+                            set() for _ in range(kind_count))
+                    session_targets[n].add(key)
 
         async with TaskGroup() as group:
             for session in self.sessions:
-                await group.spawn(session.notify, touched, height_changed, assets, q, h, b, f, v, qv)
+                session_targets = targets.get(session)
+                if session_targets is None:
+                    # Don't bother spawning a task for sessions with nothing to hear
+                    if not session.wants_notify(touched, height_changed):
+                        continue
+                    session_targets = no_targets
+                await group.spawn(session.notify, touched, height_changed, *session_targets)
+
+    async def shared_status(self, kind, key, status_func):
+        '''Return a pair (status, cached) for the asset or tag key of the given subscription
+        kind.  status_func(key) is awaited to calculate the status unless it is cached.
+
+        The status of a key is the same for every session, so it is cached until the key is
+        next touched.  The calculation itself is cached so that the sessions notified of a
+        touched key share it rather than each calculating the status.
+        '''
+        cache_key = (kind, key)
+        task = self._shared_status_cache.get(cache_key)
+        cached = task is not None
+        if not cached:
+            task = asyncio.ensure_future(self._calc_shared_status(cache_key, status_func))
+            self._shared_status_cache[cache_key] = task
+        return await asyncio.shield(task), cached
+
+    async def _calc_shared_status(self, cache_key, status_func):
+        try:
+            return await status_func(cache_key[1])
+        except BaseException:
+            # Don't keep the failure; the next request calculates it again
+            if self._shared_status_cache.get(cache_key) is asyncio.current_task():
+                del self._shared_status_cache[cache_key]
+            raise
+
+    def _index_sub(self, kind, key, session):
+        '''Record that session subscribed to key, an asset or tag subscription of the given
+        kind.'''
+        # The session may have disconnected whilst its subscription status was calculated
+        if session in self.sessions:
+            self._sub_indices[kind][key].add(session)
+
+    def _unindex_sub(self, kind, key, session):
+        index = self._sub_indices[kind]
+        sessions = index.get(key)
+        if sessions is not None:
+            sessions.discard(session)
+            if not sessions:
+                del index[key]
 
     def _ip_addr_group_name(self, session):
         host = session.remote_address().host
         if isinstance(host, IPv4Address):
             if host.is_private:  # exempt private addresses
                 return None
-            return '.'.join(str(host).split('.')[:3])  # /24
+            return f'v4:{int(host) >> 8:06x}'  # /24
         if isinstance(host, IPv6Address):
             if host.is_private:
                 return None
-            return ':'.join(host.exploded.split(':')[:3])  # /48
+            return f'v6:{int(host) >> 80:012x}'  # /48
         return 'unknown_addr'
 
     def _timeslice_name(self, session):
@@ -908,6 +1261,9 @@ class SessionManager:
         for group in groups:
             group.retained_cost += session.cost
             group.sessions.remove(session)
+        for kind in ASSET_SUB_KINDS:
+            for key in getattr(session, kind, ()):
+                self._unindex_sub(kind, key, session)
 
 
 class SessionBase(RPCSession):
@@ -917,12 +1273,28 @@ class SessionBase(RPCSession):
     sessions.
     '''
 
+    __slots__ = ('session_mgr', 'db', 'mempool', 'peer_mgr', 'kind', 'env', 'coin', 'client',
+                 'anon_logs', 'txs_sent', 'session_id', 'daemon_request', 'logger',
+                 'method_counts', 'topics', '_remote_address_str')
+
     MAX_CHUNK_SIZE = 2016
     session_counter = itertools.count()
     log_new = False
+    # JSON-RPC method name -> handler method name, and -> handler function
+    HANDLER_NAMES = MappingProxyType({})
+    handlers = MappingProxyType({})
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Resolved per class so that a subclass's overriding handlers are used
+        cls.handlers = MappingProxyType({method: getattr(cls, name)
+                                         for method, name in cls.HANDLER_NAMES.items()})
 
     def __init__(self, session_mgr, db: 'DB', mempool: 'MemPool', peer_mgr: 'PeerManager', kind, transport):
-        connection = JSONRPCConnection(JSONRPCAutoDetect)
+        if orjson is None:
+            connection = JSONRPCConnection(JSONRPCAutoDetect)
+        else:
+            connection = OrjsonRPCConnection()
         super().__init__(transport, connection=connection)
         self.session_mgr = session_mgr
         self.db = db
@@ -937,6 +1309,8 @@ class SessionBase(RPCSession):
         self.log_me = SessionBase.log_new
         self.session_id = None
         self.daemon_request = self.session_mgr.daemon_request
+        # The remote address is fixed for the life of the session; format it once
+        self._remote_address_str = str(self.remote_address())
         self.session_id = next(self.session_counter)
         context = {'conn_id': f'{self.session_id}'}
         logger = util.class_logger(__name__, self.__class__.__name__)
@@ -945,9 +1319,14 @@ class SessionBase(RPCSession):
                          f'{self.session_mgr.session_count():,d} total')
         self.session_mgr.add_session(self)
         self.recalc_concurrency()  # must be called after session_mgr.add_session
-        self.request_handlers = {}
+        self.method_counts = session_mgr._method_counts
         self.topics = set()  # New attribute to store topics of interest
 
+    def wants_notify(self, touched, height_changed):
+        '''Return True if notify() might have something to send the client besides asset and
+        tag subscriptions, which the session manager tracks itself.'''
+        return False
+
     async def notify(self, touched, height_changed, assets, q, h, b, f, v, qv):
         '''Notify the client about changes to touched addresses and assets.'''
         # Example of sending topic-based notifications
@@ -957,14 +1336,14 @@ class SessionBase(RPCSession):
         #        await self.send_notification(f'topic.{topic}.update', data)
 
     def default_framer(self):
-        return NewlineFramer(max_size=self.env.max_recv)
+        return BufferedNewlineFramer(max_size=self.env.max_recv)
 
     def remote_address_string(self, *, for_log=True):
         '''Returns the peer's IP address and port as a human-readable
         string, respecting anon logs if the output is for a log.'''
         if for_log and self.anon_logs:
             return 'xx.xx.xx.xx:xx'
-        return str(self.remote_address())
+        return self._remote_address_str
 
     def flags(self):
         '''Status flags.'''
@@ -997,22 +1376,17 @@ class SessionBase(RPCSession):
         notifications from client sessions.
         '''
         if isinstance(request, Request):
-            handler = self.request_handlers.get(request.method)
-            if handler is None and request.method == 'subscribe_topics':
-                return await self.subscribe_topics(request.params)
+            handler = self.handlers.get(request.method)
         else:
             handler = None
-        method = 'invalid method' if handler is None else request.method
-        self.session_mgr._method_counts[method] += 1
-        coro = handler_invocation(handler, request)()
-        return await coro
+        self.method_counts['invalid method' if handler is None else request.method] += 1
+        return await cached_handler_invocation(handler, request, self)()
 
-    async def subscribe_topics(self, topics: set[str]):
+    async def subscribe_topics(self, *topics):
         '''Subscribe to a list of topics.'''
-        if isinstance(topics, list):
-            topics = set(topics)
-        if not isinstance(topics, set) or not all(isinstance(topic, str) for topic in topics):
+        if not all(isinstance(topic, str) for topic in topics):
             raise RPCError(BAD_REQUEST, 'expected a list of topic strings')
+        topics = set(topics)
         self.topics.update(topics)
         return f'Subscribed to topics: {", ".join(topics)}'
 
@@ -1032,20 +1406,85 @@ def check_asset(name):
         ) from None
 
 
-def check_h160(h160):
+def check_asset_filter(asset):
+    '''Check the asset argument of balance and UTXO queries: a boolean, an asset name or a
+    list of asset names.  Returns the asset names asked for.'''
+    if isinstance(asset, str):
+        check_asset(asset)
+        return [asset]
+    if isinstance(asset, Iterable):
+        for a in asset:
+            if a is None:
+                continue
+            check_asset(a)
+        return asset
+    if not isinstance(asset, bool):
+        raise RPCError(
+            BAD_REQUEST, f'asset must be a list, string, or boolean'
+        ) from None
+    return []
+
+
+def handler_table(handler_names, aliases):
+    '''Return the read-only method name -> handler name table with aliases resolved to the
+    handler of the method they alias.  Method names are not identifiers so aren't interned by the
+    compiler; intern them here.'''
+    table = dict(handler_names)
+    table.update((alias, handler_names[method]) for alias, method in aliases.items())
+    return MappingProxyType({sys.intern(method): name for method, name in table.items()})
+
+
+# Handler function -> aiorpcx SignatureInfo of its bound method
+_signature_infos = {}
+
+
+def cached_handler_invocation(handler, request, instance=None):
+    '''As aiorpcx's handler_invocation(), but each handler's signature is inspected only
+    once rather than on every request.  If instance is given handler is a plain function
+    called with it as its first argument, saving a bound method per request.  Calls
+    aiorpcx's version for named arguments and to raise its errors.'''
+    args = request.args
+    if handler is not None and isinstance(args, (tuple, list)):
+        func = handler if instance is not None else getattr(handler, '__func__', handler)
+        info = _signature_infos.get(func)
+        if info is None:
+            bound = handler if instance is None else MethodType(handler, instance)
+            info = _signature_infos[func] = signature_info(bound)
+        if info.min_args <= len(args) and (info.max_args is None or len(args) <= info.max_args):
+            if instance is None:
+                return partial(handler, *args)
+            return partial(handler, instance, *args)
+    if handler is not None and instance is not None:
+        handler = MethodType(handler, instance)
+    return handler_invocation(handler, request)
+
+
+def decode_h160(h160):
+    '''Return the 20 bytes of a hex-encoded h160, validating it as it is decoded.'''
     if not isinstance(h160, str):
         raise RPCError(
             BAD_REQUEST, f'the h160 must be a string'
         ) from None
-    if len(h160) != 40:
+    try:
+        h160_b = bytes.fromhex(h160)
+    except ValueError:
+        h160_b = None
+    # bytes.fromhex() skips whitespace, so also check the string length
+    if h160_b is None or len(h160_b) != 20 or len(h160) != 40:
         raise RPCError(
-            BAD_REQUEST, f'h160 not 20 bytes'
+            BAD_REQUEST, 'h160 not 20 hex-encoded bytes'
         ) from None
+    return h160_b
 
 
 class ElectrumX(SessionBase):
     '''A TCP server that handles incoming Electrum connections.'''
 
+    __slots__ = ('subscribe_headers', 'hashX_subs', 'asset_subs', 'qualifier_tag_subs',
+                 'h160_tag_subs', 'broadcast_subs', 'frozen_subs', 'validator_subs',
+                 'qualifier_validator_subs', 'sv_seen', 'mempool_statuses', 'is_peer',
+                 'protocol_tuple')
+
     PROTOCOL_MIN = (1, 4)
     PROTOCOL_MAX = (1, 11)
     PROTOCOL_BAD = ((1, 9),)
@@ -1064,7 +1503,7 @@ class ElectrumX(SessionBase):
         self.qualifier_validator_subs = set()
         self.sv_seen = False
         self.mempool_statuses = {}
-        self.set_request_handlers(self.PROTOCOL_MIN)
+        self.protocol_tuple = self.PROTOCOL_MIN
         self.is_peer = False
         self.cost = 5.0   # Connection cost
 
@@ -1124,16 +1563,25 @@ class ElectrumX(SessionBase):
         self.mempool_statuses.pop(hashX, None)
         return self.hashX_subs.pop(hashX, None)
 
+    def wants_notify(self, touched, height_changed):
+        if touched and self.hashX_subs:
+            return True
+        return height_changed and (self.subscribe_headers or bool(self.mempool_statuses))
+
     async def notify(self, touched, height_changed, assets, q, h, b, f, v, qv):
         '''Notify the client about changes to touched addresses and assets (from mempool
         updates or new blocks) and height.
+
+        The asset and tag sets (assets to qv) hold only keys this session subscribed to.
         '''
+        if not (touched or height_changed or assets or q or h or b or f or v or qv):
+            return
 
         if height_changed and self.subscribe_headers:
             args = (await self.subscribe_headers_result(), )
             await self.send_notification('blockchain.headers.subscribe', args)
 
-        touched_assets = assets.intersection(self.asset_subs)
+        touched_assets = assets
         if touched_assets:
             method = 'blockchain.asset.subscribe'
             for asset in touched_assets:
@@ -1142,7 +1590,7 @@ class ElectrumX(SessionBase):
             es = '' if len(touched_assets) == 1 else 's'
             self.logger.info(f'notified of {len(touched_assets):,d} reissued asset{es}')
 
-        touched_qualifier_tags = q.intersection(self.qualifier_tag_subs)
+        touched_qualifier_tags = q
         if touched_qualifier_tags:
             method = 'blockchain.tag.qualifier.subscribe'
             for qualifier in touched_qualifier_tags:
@@ -1151,17 +1599,16 @@ class ElectrumX(SessionBase):
             es = '' if len(touched_qualifier_tags) == 1 else 's'
             self.logger.info(f'notified of {len(touched_qualifier_tags):,d} qualifier tagging{es}')
 
-        touched_h160_tags = h.intersection(self.h160_tag_subs)
+        touched_h160_tags = h
         if touched_h160_tags:
             method = 'blockchain.tag.h160.subscribe'
             for h160 in touched_h160_tags:
-                h160_h = h160.hex()
-                status = await self.tags_for_h160_status(h160_h)
-                await self.send_notification(method, (h160_h, status))
+                status = await self.tags_for_h160_status(h160)
+                await self.send_notification(method, (h160.hex(), status))
             es = '' if len(touched_h160_tags) == 1 else 's'
             self.logger.info(f'notified of {len(touched_h160_tags):,d} h160 tagging{es}')
 
-        touched_asset_broadcasts = b.intersection(self.broadcast_subs)
+        touched_asset_broadcasts = b
         if touched_asset_broadcasts:
             method = 'blockchain.asset.broadcasts.subscribe'
             for asset in touched_asset_broadcasts:
@@ -1170,7 +1617,7 @@ class ElectrumX(SessionBase):
             es = '' if len(touched_asset_broadcasts) == 1 else 's'
             self.logger.info(f'notified of {len(touched_asset_broadcasts):,d} broadcast{es}')
 
-        touched_asset_freezes = f.intersection(self.frozen_subs)
+        touched_asset_freezes = f
         if touched_asset_freezes:
             method = 'blockchain.asset.is_frozen.subscribe'
             for asset in touched_asset_freezes:
@@ -1179,7 +1626,7 @@ class ElectrumX(SessionBase):
             es = '' if len(touched_asset_freezes) == 1 else 's'
             self.logger.info(f'notified of {len(touched_asset_freezes):,d} freezes{es}')
 
-        touched_asset_verifier_strings = v.intersection(self.validator_subs)
+        touched_asset_verifier_strings = v
         if touched_asset_verifier_strings:
             method = 'blockchain.asset.verifier_string.subscribe'
             for asset in touched_asset_verifier_strings:
@@ -1189,7 +1636,7 @@ class ElectrumX(SessionBase):
             self.logger.info(
                 f'notified of {len(touched_asset_verifier_strings):,d} verifier change{es}')
 
-        touched_qualifiers_that_are_in_verifiers = qv.intersection(self.qualifier_validator_subs)
+        touched_qualifiers_that_are_in_verifiers = qv
         if touched_qualifiers_that_are_in_verifiers:
             method = 'blockchain.asset.restricted_associations.subscribe'
             for asset in touched_qualifiers_that_are_in_verifiers:
@@ -1210,14 +1657,17 @@ class ElectrumX(SessionBase):
                     changed[alias] = status
 
             # Check mempool hashXs - the status is a function of the confirmed state of
-            # other transactions.
-            mempool_statuses = self.mempool_statuses.copy()
-            for hashX, old_status in mempool_statuses.items():
-                alias = self.hashX_subs.get(hashX)
-                if alias:
-                    status = await self.subscription_address_status(hashX)
-                    if status != old_status:
-                        changed[alias] = status
+            # other transactions.  Those just checked as touched need no second look.
+            # Snapshot the items as the dict changes as statuses are recalculated.
+            if self.mempool_statuses:
+                for hashX, old_status in list(self.mempool_statuses.items()):
+                    if hashX in touched:
+                        continue
+                    alias = self.hashX_subs.get(hashX)
+                    if alias:
+                        status = await self.subscription_address_status(hashX)
+                        if status != old_status:
+                            changed[alias] = status
 
             method = 'blockchain.scripthash.subscribe'
             for alias, status in changed.items():
@@ -1248,7 +1698,31 @@ class ElectrumX(SessionBase):
         self.bump_cost(1.0)
         return self.peer_mgr.on_peers_subscribe(self.is_tor())
 
+    def _status_hash(self, status):
+        '''Charge for a status string and return its SHA-256 as hex, or None if it is
+        empty.'''
+        if not status:
+            self.bump_cost(0.1)
+            return None
+        self.bump_cost(0.1 + len(status) * 0.00002)
+        return hashlib.sha256(status.encode()).hexdigest()
+
+    @staticmethod
+    def _sorted_items(data):
+        '''Return the items of a dict sorted by key.'''
+        # Keys are unique so the values are never compared
+        return sorted(data.items())
+
+    async def _shared_status(self, kind, key, status_func):
+        status, cached = await self.session_mgr.shared_status(kind, key, status_func)
+        if cached:
+            self.bump_cost(0.1)
+        return status
+
     async def asset_status(self, asset):
+        return await self._shared_status('asset_subs', asset, self._asset_status)
+
+    async def _asset_status(self, asset):
         asset_data = await self.asset_get_meta(asset)
 
         if asset_data:
@@ -1259,11 +1733,11 @@ class ElectrumX(SessionBase):
             reissuable = asset_data['reissuable']
             has_ipfs = asset_data['has_ipfs']
 
-            h = ''.join([str(sats), str(div_amt), str(reissuable), str(has_ipfs)])
+            h = f'{sats}{div_amt}{reissuable}{has_ipfs}'
             if has_ipfs:
                 h += asset_data['ipfs']
 
-            status = sha256(h.encode('ascii')).hex()
+            status = hashlib.sha256(h.encode('ascii')).hexdigest()
         else:
             self.bump_cost(0.1)
             status = None
@@ -1271,60 +1745,48 @@ class ElectrumX(SessionBase):
         return status
 
     async def tags_for_qualifier_status(self, qualifier: str):
+        return await self._shared_status('qualifier_tag_subs', qualifier,
+                                         self._tags_for_qualifier_status)
+
+    async def _tags_for_qualifier_status(self, qualifier: str):
         if qualifier[0] != '#' and qualifier[0] != '$':
             raise RPCError(
                 BAD_REQUEST, f'{qualifier} is not a qualifier nor a restricted asset'
             ) from None
         data = await self.qualifications_for_qualifier(qualifier)
-        s_data = sorted(data.items(), key=lambda x: x[0])
-        if s_data:
-            status = ';'.join(
-                f'{h160}:{d["height"]}{d["tx_hash"]}{d["tx_pos"]}{d["flag"]}' for h160, d in s_data)
-            self.bump_cost(0.1 + len(status) * 0.00002)
-            status = sha256(status.encode()).hex()
-        else:
-            self.bump_cost(0.1)
-            status = None
-        return status
+        s_data = self._sorted_items(data)
+        return self._status_hash(';'.join(
+            f'{h160}:{d["height"]}{d["tx_hash"]}{d["tx_pos"]}{d["flag"]}' for h160, d in s_data))
 
-    async def tags_for_h160_status(self, h160):
-        data = await self.qualifications_for_h160(h160)
-        s_data = sorted(data.items(), key=lambda x: x[0])
-        if s_data:
-            status = ';'.join(
-                f'{asset}:{d["height"]}{d["tx_hash"]}{d["tx_pos"]}{d["flag"]}' for asset, d in s_data)
-            self.bump_cost(0.1 + len(status) * 0.00002)
-            status = sha256(status.encode()).hex()
-        else:
-            self.bump_cost(0.1)
-            status = None
-        return status
+    async def tags_for_h160_status(self, h160: bytes):
+        return await self._shared_status('h160_tag_subs', h160, self._tags_for_h160_status)
+
+    async def _tags_for_h160_status(self, h160: bytes):
+        data = await self._qualifications_for_h160(h160)
+        s_data = self._sorted_items(data)
+        return self._status_hash(';'.join(
+            f'{asset}:{d["height"]}{d["tx_hash"]}{d["tx_pos"]}{d["flag"]}' for asset, d in s_data))
 
     async def broadcasts_status(self, asset):
+        return await self._shared_status('broadcast_subs', asset, self._broadcasts_status)
+
+    async def _broadcasts_status(self, asset):
         data = await self.get_messages(asset)
-        s_data = sorted(data, key=lambda x: (x["height"], x['tx_hash'], x["tx_pos"]))
-        if s_data:
-            status = ';'.join(
-                f'{d["tx_hash"]}:{d["height"]}{d["tx_pos"]}{d["data"]}{d["expiration"]}' for d in s_data)
-            self.bump_cost(0.1 + len(status) * 0.00002)
-            status = sha256(status.encode()).hex()
-        else:
-            self.bump_cost(0.1)
-            status = None
-        return status
+        s_data = sorted(data, key=itemgetter('height', 'tx_hash', 'tx_pos'))
+        return self._status_hash(';'.join(
+            f'{d["tx_hash"]}:{d["height"]}{d["tx_pos"]}{d["data"]}{d["expiration"]}'
+            for d in s_data))
 
     async def qualifier_associations_status(self, asset):
+        return await self._shared_status('qualifier_validator_subs', asset,
+                                         self._qualifier_associations_status)
+
+    async def _qualifier_associations_status(self, asset):
         data = await self.lookup_qualifier_associations(asset)
-        s_data = sorted(data.items(), key=lambda x: x[0])
-        if s_data:
-            status = ';'.join(
-                f'{asset}:{d["height"]}{d["tx_hash"]}{d["restricted_tx_pos"]}{d["qualifying_tx_pos"]}{d["associated"]}' for asset, d in s_data)
-            self.bump_cost(0.1 + len(status) * 0.00002)
-            status = sha256(status.encode()).hex()
-        else:
-            self.bump_cost(0.1)
-            status = None
-        return status
+        s_data = self._sorted_items(data)
+        return self._status_hash(';'.join(
+            f'{asset}:{d["height"]}{d["tx_hash"]}{d["restricted_tx_pos"]}'
+            f'{d["qualifying_tx_pos"]}{d["associated"]}' for asset, d in s_data))
 
     async def address_status(self, hashX):
         '''Returns an address status.
@@ -1333,21 +1795,24 @@ class ElectrumX(SessionBase):
         '''
         # Note history is ordered and mempool unordered in electrum-server
         # For mempool, height is -1 if it has unconfirmed inputs, otherwise 0
+        reorg_count = self.session_mgr._reorg_count
         db_history, cost = await self.session_mgr.limited_history(hashX)
         mempool = await self.mempool.transaction_summaries(hashX)
 
-        status = ''.join(f'{hash_to_hex_str(tx_hash)}:'
-                         f'{height:d}:'
-                         for tx_hash, height in db_history)
-        status += ''.join(f'{hash_to_hex_str(tx.hash)}:'
-                          f'{-tx.has_unconfirmed_inputs:d}:'
-                          for tx in mempool)
+        # Only history not seen before and the mempool need hashing
+        hasher, status_len = self.session_mgr.confirmed_status_hasher(hashX, db_history,
+                                                                      reorg_count)
+        if mempool:
+            mempool_status = address_status_bytes(
+                (tx.hash for tx in mempool), (-tx.has_unconfirmed_inputs for tx in mempool))
+            hasher.update(mempool_status)
+            status_len += len(mempool_status)
 
         # Add status hashing cost
-        self.bump_cost(cost + 0.1 + len(status) * 0.00002)
+        self.bump_cost(cost + 0.1 + status_len * 0.00002)
 
-        if status:
-            status = sha256(status.encode()).hex()
+        if status_len:
+            status = hasher.hexdigest()
         else:
             status = None
 
@@ -1372,29 +1837,25 @@ class ElectrumX(SessionBase):
         effects.'''
         if asset is None:
             asset = False
-        if isinstance(asset, str):
-            check_asset(asset)
-        elif isinstance(asset, Iterable):
-            for a in asset:
-                if a is None:
-                    continue
-                check_asset(a)
-        elif not isinstance(asset, bool):
-            raise RPCError(
-                BAD_REQUEST, f'asset must be a list, string, or boolean'
-            ) from None
+        check_asset_filter(asset)
+        result, cost = await self._hashX_listunspent(hashX, asset)
+        self.bump_cost(cost)
+        return result
 
+    async def _hashX_listunspent(self, hashX, asset):
+        '''Return a pair (utxos, cost) for hashX_listunspent() with a checked asset
+        argument.'''
         utxos = await self.db.all_utxos(hashX, asset)
         utxos = sorted(utxos)
         utxos.extend(await self.mempool.unordered_UTXOs(hashX, asset))
-        self.bump_cost(1.0 + len(utxos) / 50)
+        cost = 1.0 + len(utxos) / 50
         spends = await self.mempool.potential_spends(hashX)
 
         return [{'tx_hash': hash_to_hex_str(utxo.tx_hash),
                  'tx_pos': utxo.tx_pos,
                  'height': utxo.height, 'asset': utxo.name, 'value': utxo.value}
                 for utxo in utxos
-                if (utxo.tx_hash, utxo.tx_pos) not in spends]
+                if (utxo.tx_hash, utxo.tx_pos) not in spends], cost
 
     async def hashX_subscribe(self, hashX, alias):
         # Store the subscription only after address_status succeeds
@@ -1406,62 +1867,72 @@ class ElectrumX(SessionBase):
         check_asset(asset)
         result = await self.asset_status(asset)
         self.asset_subs.add(asset)
+        self.session_mgr._index_sub('asset_subs', asset, self)
         return result
 
     async def asset_unsubscribe(self, asset):
         check_asset(asset)
+        self.session_mgr._unindex_sub('asset_subs', asset, self)
         return self.asset_subs.discard(asset) is not None
 
     async def subscribe_qualifier_tagging(self, qualifier):
         check_asset(qualifier)
         result = await self.tags_for_qualifier_status(qualifier)
         self.qualifier_tag_subs.add(qualifier)
+        self.session_mgr._index_sub('qualifier_tag_subs', qualifier, self)
         return result
 
     async def unsubscribe_qualifier_tagging(self, qualifier):
         check_asset(qualifier)
+        self.session_mgr._unindex_sub('qualifier_tag_subs', qualifier, self)
         return self.qualifier_tag_subs.discard(qualifier) is not None
 
     async def subscribe_h160_tagged(self, h160):
-        check_h160(h160)
-        h160_b = bytes.fromhex(h160)
-        result = await self.tags_for_h160_status(h160)
+        h160_b = decode_h160(h160)
+        result = await self.tags_for_h160_status(h160_b)
         self.h160_tag_subs.add(h160_b)
+        self.session_mgr._index_sub('h160_tag_subs', h160_b, self)
         return result
 
     async def unsubscribe_h160_tagged(self, h160):
-        check_h160(h160)
-        h160_b = bytes.fromhex(h160)
+        h160_b = decode_h160(h160)
+        self.session_mgr._unindex_sub('h160_tag_subs', h160_b, self)
         return self.h160_tag_subs.discard(h160_b) is not None
 
     async def subscribe_broadcast(self, asset):
         check_asset(asset)
         result = await self.broadcasts_status(asset)
         self.broadcast_subs.add(asset)
+        self.session_mgr._index_sub('broadcast_subs', asset, self)
         return result
 
     async def unsubscribe_broadcast(self, asset):
         check_asset(asset)
+        self.session_mgr._unindex_sub('broadcast_subs', asset, self)
         return self.broadcast_subs.discard(asset) is not None
 
     async def subscribe_asset_freeze(self, asset):
         check_asset(asset)
         result = await self.is_restricted_frozen(asset)
         self.frozen_subs.add(asset)
+        self.session_mgr._index_sub('frozen_subs', asset, self)
         return result
 
     async def unsubscribe_asset_freeze(self, asset):
         check_asset(asset)
+        self.session_mgr._unindex_sub('frozen_subs', asset, self)
         return self.frozen_subs.discard(asset) is not None
 
     async def subscribe_restricted_verification_change(self, asset):
         check_asset(asset)
         result = await self.get_restricted_string(asset)
         self.validator_subs.add(asset)
+        self.session_mgr._index_sub('validator_subs', asset, self)
         return result
 
     async def unsubscribe_restricted_verification_change(self, asset):
         check_asset(asset)
+        self.session_mgr._unindex_sub('validator_subs', asset, self)
         return self.validator_subs.discard(asset) is not None
 
     async def subscribe_qualifier_associated_restricted(self, asset):
@@ -1472,6 +1943,7 @@ class ElectrumX(SessionBase):
             ) from None
         result = await self.qualifier_associations_status(asset)
         self.qualifier_validator_subs.add(asset)
+        self.session_mgr._index_sub('qualifier_validator_subs', asset, self)
         return result
 
     async def unsubscribe_qualifier_associated_restricted(self, asset):
@@ -1480,36 +1952,35 @@ class ElectrumX(SessionBase):
             raise RPCError(
                 BAD_REQUEST, f'{asset} is not a qualifier'
             ) from None
+        self.session_mgr._unindex_sub('qualifier_validator_subs', asset, self)
         return self.qualifier_validator_subs.discard(asset) is not None
 
     async def get_balance(self, hashX, asset):
-        must_have_names = []
-        if isinstance(asset, str):
-            check_asset(asset)
-            must_have_names = [asset]
-        elif isinstance(asset, Iterable):
-            for a in asset:
-                if a is None:
-                    continue
-                check_asset(a)
-            must_have_names = asset
-        elif not isinstance(asset, bool):
-            raise RPCError(
-                BAD_REQUEST, f'asset must be a list, string, or boolean'
-            ) from None
+        must_have_names = check_asset_filter(asset)
+        result, cost = await self._get_balance(hashX, asset, must_have_names)
+        self.bump_cost(cost)
+        return result
+
+    async def _get_balance(self, hashX, asset, must_have_names):
+        '''Return a pair (balance, cost) for get_balance() with a checked asset argument.'''
         utxos = await self.db.all_utxos(hashX, asset)
-        confirmed = defaultdict(int)
-        for utxo in utxos:
-            confirmed[utxo.name] += utxo.value
         unconfirmed: Dict[Optional[str], int] = await self.mempool.balance_delta(hashX, asset)
-        self.bump_cost(1.0 + len(utxos) / 50)
+        cost = 1.0 + len(utxos) / 50
         include_names = asset is True or (asset is not False and not isinstance(asset, str))
         if include_names:
-            return {(k or 'rvn'): {'confirmed': confirmed[k], 'unconfirmed': unconfirmed[k]} for k in set(confirmed.keys()).union(unconfirmed.keys()).union(must_have_names)}
+            confirmed = defaultdict(int)
+            for utxo in utxos:
+                confirmed[utxo.name] += utxo.value
+            names = dict.fromkeys(confirmed)
+            names.update(dict.fromkeys(unconfirmed))
+            names.update(dict.fromkeys(must_have_names))
+            return {(name or 'rvn'): {'confirmed': confirmed.get(name, 0),
+                                      'unconfirmed': unconfirmed.get(name, 0)}
+                    for name in names}, cost
         else:
-            confirmed = 0 if len(confirmed) == 0 else confirmed[list(confirmed.keys())[0]]
-            unconfirmed = 0 if len(unconfirmed) == 0 else unconfirmed[list(unconfirmed.keys())[0]]
-            return {'confirmed': confirmed, 'unconfirmed': unconfirmed}
+            # All the UTXOs are of the single asset asked for; the base coin is keyed by None
+            return {'confirmed': sum(utxo.value for utxo in utxos),
+                    'unconfirmed': unconfirmed.get(asset or None, 0)}, cost
 
     async def scripthash_get_balance(self, scripthash, asset=False):
         '''Return the confirmed and unconfirmed balance of a scripthash.'''
@@ -1517,22 +1988,36 @@ class ElectrumX(SessionBase):
         return await self.get_balance(hashX, asset)
 
     async def unconfirmed_history(self, hashX):
+        result, cost = await self._unconfirmed_history(hashX)
+        self.bump_cost(cost)
+        return result
+
+    async def _unconfirmed_history(self, hashX):
+        '''Return a pair (unconfirmed history, cost).'''
         # Note unconfirmed history is unordered in electrum-server
         # height is -1 if it has unconfirmed inputs, otherwise 0
-        result = [{'tx_hash': hash_to_hex_str(tx.hash),
+        summaries = await self.mempool.transaction_summaries(hashX)
+        tx_hash_strs = hashes_to_hex_strs(tx.hash for tx in summaries)
+        result = [{'tx_hash': tx_hash_str,
                    'height': -tx.has_unconfirmed_inputs,
                    'fee': tx.fee}
-                  for tx in await self.mempool.transaction_summaries(hashX)]
-        self.bump_cost(0.25 + len(result) / 50)
-        return result
+                  for tx_hash_str, tx in zip(tx_hash_strs, summaries)]
+        return result, 0.25 + len(result) / 50
 
     async def confirmed_and_unconfirmed_history(self, hashX):
+        result, cost = await self._confirmed_and_unconfirmed_history(hashX)
+        self.bump_cost(cost)
+        return result
+
+    async def _confirmed_and_unconfirmed_history(self, hashX):
+        '''Return a pair (history, cost).'''
         # Note history is ordered but unconfirmed is unordered in e-s
         history, cost = await self.session_mgr.limited_history(hashX)
-        self.bump_cost(cost)
-        conf = [{'tx_hash': hash_to_hex_str(tx_hash), 'height': height}
-                for tx_hash, height in history]
-        return conf + await self.unconfirmed_history(hashX)
+        tx_hash_strs = hashes_to_hex_strs(tx_hash for tx_hash, _height in history)
+        conf = [{'tx_hash': tx_hash_str, 'height': height}
+                for tx_hash_str, (_tx_hash, height) in zip(tx_hash_strs, history)]
+        unconf, unconf_cost = await self._unconfirmed_history(hashX)
+        return conf + unconf, cost + unconf_cost
 
     async def scripthash_get_history(self, scripthash):
         '''Return the confirmed and unconfirmed history of a scripthash.'''
@@ -1549,6 +2034,53 @@ class ElectrumX(SessionBase):
         hashX = scripthash_to_hashX(scripthash)
         return await self.hashX_listunspent(hashX, asset)
 
+    def scripthashes_to_hashXs(self, scripthashes):
+        '''Return the hashXs of a list of script hashes.  Raises RPCError.'''
+        if not isinstance(scripthashes, list) or not scripthashes:
+            raise RPCError(BAD_REQUEST, 'scripthashes must be a non-empty list')
+        if len(scripthashes) > MAX_SCRIPTHASH_BATCH:
+            raise RPCError(BAD_REQUEST, f'at most {MAX_SCRIPTHASH_BATCH:,d} scripthashes '
+                           'can be queried at once')
+        return [scripthash_to_hashX(scripthash) for scripthash in scripthashes]
+
+    async def _batch_lookup(self, hashXs, lookup, unit_cost):
+        '''Return the results of awaiting lookup(hashX), which returns a pair (result, cost),
+        for each hashX in turn rather than running up to MAX_SCRIPTHASH_BATCH DB scans at
+        once.  unit_cost per hashX is charged before any lookup so that cost limits apply to
+        the whole batch; the balance is charged once the lookup costs are known.'''
+        prepaid = unit_cost * len(hashXs)
+        self.bump_cost(prepaid)
+        results = []
+        total_cost = 0.0
+        for hashX in hashXs:
+            result, cost = await lookup(hashX)
+            results.append(result)
+            total_cost += cost
+        self.bump_cost(total_cost - prepaid)
+        return results
+
+    async def scripthashes_get_balance(self, scripthashes, asset=False):
+        '''Return the balances of a list of scripthashes, in the same order.'''
+        hashXs = self.scripthashes_to_hashXs(scripthashes)
+        must_have_names = check_asset_filter(asset)
+        return await self._batch_lookup(
+            hashXs, partial(self._get_balance, asset=asset, must_have_names=must_have_names),
+            1.0)
+
+    async def scripthashes_get_history(self, scripthashes):
+        '''Return the histories of a list of scripthashes, in the same order.'''
+        hashXs = self.scripthashes_to_hashXs(scripthashes)
+        return await self._batch_lookup(hashXs, self._confirmed_and_unconfirmed_history, 0.35)
+
+    async def scripthashes_listunspent(self, scripthashes, asset=False):
+        '''Return the UTXOs of a list of scripthashes, in the same order.'''
+        hashXs = self.scripthashes_to_hashXs(scripthashes)
+        if asset is None:
+            asset = False
+        check_asset_filter(asset)
+        return await self._batch_lookup(
+            hashXs, partial(self._hashX_listunspent, asset=asset), 1.0)
+
     async def scripthash_subscribe(self, scripthash):
         '''Subscribe to a script hash.
 
@@ -1569,11 +2101,10 @@ class ElectrumX(SessionBase):
                            f'require header height {height:,d} <= '
                            f'cp_height {cp_height:,d} <= '
                            f'chain height {max_height:,d}')
-        branch, root = await self.db.header_branch_and_root(cp_height + 1,
-                                                            height)
+        branch, root = await self.session_mgr.header_merkle_proof(cp_height, height)
         return {
-            'branch': [hash_to_hex_str(elt) for elt in branch],
-            'root': hash_to_hex_str(root),
+            'branch': branch,
+            'root': root,
         }
 
     async def block_header(self, height, cp_height=0):
@@ -1621,21 +2152,20 @@ class ElectrumX(SessionBase):
         return self.remote_address().host == proxy_address.host
 
     async def replaced_banner(self, banner):
-        network_info = await self.daemon_request('getnetworkinfo')
+        network_info = await self.session_mgr.network_info()
         ni_version = network_info['version']
         major, minor = divmod(ni_version, 1000000)
         minor, revision = divmod(minor, 10000)
         revision //= 100
         daemon_version = '{:d}.{:d}.{:d}'.format(major, minor, revision)
-        for pair in [
-                ('$SERVER_VERSION', electrumx.version_short),
-                ('$SERVER_SUBVERSION', electrumx.version),
-                ('$DAEMON_VERSION', daemon_version),
-                ('$DAEMON_SUBVERSION', network_info['subversion']),
-                ('$DONATION_ADDRESS', self.env.donation_address),
-        ]:
-            banner = banner.replace(*pair)
-        return banner
+        replacements = {
+            '$SERVER_VERSION': electrumx.version_short,
+            '$SERVER_SUBVERSION': electrumx.version,
+            '$DAEMON_VERSION': daemon_version,
+            '$DAEMON_SUBVERSION': network_info['subversion'],
+            '$DONATION_ADDRESS': self.env.donation_address,
+        }
+        return BANNER_VARIABLES_RE.sub(lambda match: replacements[match.group()], banner)
 
     async def donation_address(self):
         '''Return the donation address as a string, empty if there is none.'''
@@ -1653,8 +2183,7 @@ class ElectrumX(SessionBase):
             banner_file = self.env.banner_file
         if banner_file:
             try:
-                with codecs.open(banner_file, 'r', 'utf-8') as f:
-                    banner = f.read()
+                banner = self.session_mgr.banner_file_text(banner_file)
             except (OSError, UnicodeDecodeError) as e:
                 self.logger.error(f'reading banner file {banner_file}: {e!r}')
             else:
@@ -1666,7 +2195,7 @@ class ElectrumX(SessionBase):
         '''The minimum fee a low-priority tx must pay in order to be accepted
         to the daemon's memory pool.'''
         self.bump_cost(2.0)
-        res = await self.daemon_request('getnetworkinfo')
+        res = await self.session_mgr.network_info()
         res = res['relayfee']
         assert res
         return res
@@ -1685,24 +2214,26 @@ class ElectrumX(SessionBase):
 
         number = self.coin.bucket_estimatefee_block_target(number)
         cache = self.session_mgr.estimatefee_cache
+        tip = self.session_mgr.bp.state.tip
 
+        # Each entry is a (blockhash, feerate) pair, or a (blockhash, fetch task) pair whilst
+        # the estimate is fetched.  Concurrent requests for it all await the one task.
         cache_item = cache.get((number, mode))
-        if cache_item is not None:
-            blockhash, feerate, lock = cache_item
-            if blockhash and blockhash == self.session_mgr.bp.state.tip:
+        if cache_item is not None and cache_item[0] == tip:
+            feerate = cache_item[1]
+            if not isinstance(feerate, asyncio.Future):
                 return feerate
+            fetch = feerate
         else:
-            # create lock now, store it, and only then await on it
-            lock = asyncio.Lock()
-            cache[(number, mode)] = (None, None, lock)
-        async with lock:
-            cache_item = cache.get((number, mode))
-            if cache_item is not None:
-                blockhash, feerate, lock = cache_item
-                if blockhash == self.session_mgr.bp.state.tip:
-                    return feerate
             self.bump_cost(2.0)  # cache miss incurs extra cost
-            blockhash = self.session_mgr.bp.state.tip
+            fetch = asyncio.ensure_future(self._fetch_estimatefee(number, mode, tip))
+            cache[(number, mode)] = (tip, fetch)
+        # Shield the shared task from the cancellation of any one request
+        return await asyncio.shield(fetch)
+
+    async def _fetch_estimatefee(self, number, mode, blockhash):
+        cache = self.session_mgr.estimatefee_cache
+        try:
             if mode:
                 feerate = await self.daemon_request('estimatesmartfee', number, mode)
             else:
@@ -1713,9 +2244,16 @@ class ElectrumX(SessionBase):
                 # If there is no estimated fee avaliable, use the minimum value
                 feerate = await self.relayfee()
             assert feerate is not None
-            assert blockhash is not None
-            cache[(number, mode)] = (blockhash, feerate, lock)
-            return feerate
+        except BaseException:
+            # Don't cache the failure; the next request tries again
+            cache_item = cache.get((number, mode))
+            if cache_item is not None and cache_item[1] is asyncio.current_task():
+                del cache[(number, mode)]
+            raise
+        cache_item = cache.get((number, mode))
+        if cache_item is not None and cache_item[1] is asyncio.current_task():
+            cache[(number, mode)] = (blockhash, feerate)
+        return feerate
 
     async def ping(self):
         '''Serves as a connection keep-alive mechanism and for the client to
@@ -1759,7 +2297,7 @@ class ElectrumX(SessionBase):
                                  f'- is your software out of date?')
             raise ReplyAndDisconnect(RPCError(
                 BAD_REQUEST, f'unsupported protocol version: {protocol_version}'))
-        self.set_request_handlers(ptuple)
+        self.protocol_tuple = ptuple
 
         return (electrumx.version, self.protocol_version_string())
 
@@ -1873,15 +2411,9 @@ class ElectrumX(SessionBase):
             self.bump_cost(cost)
             return {"tx_hash": tx_hash, "merkle": branch}
         else:
-            tx_hashes, cost = await self.session_mgr.tx_hashes_at_blockheight(height)
-            try:
-                tx_hash = tx_hashes[tx_pos]
-            except IndexError:
-                raise RPCError(
-                    BAD_REQUEST, f'no tx at position {tx_pos:,d} in block at height {height:,d}'
-                ) from None
+            tx_hash, cost = await self.session_mgr.tx_hash_hex(height, tx_pos)
             self.bump_cost(cost)
-            return hash_to_hex_str(tx_hash)
+            return tx_hash
 
     async def asset_get_meta_history(self, name: str, include_mempool=True):
         check_asset(name)
@@ -1904,13 +2436,15 @@ class ElectrumX(SessionBase):
     async def asset_get_meta(self, name: str, include_mempool=True):
         self.bump_cost(1.0)
         check_asset(name)
-        mempool_data = await self.mempool.get_asset_creation_if_any(name)
-        if mempool_data and include_mempool:
+        # The mempool lookups are in-memory and never suspend, so only the DB lookup would
+        # gain from running concurrently; skip the mempool entirely when it isn't wanted
+        mempool_data = include_mempool and await self.mempool.get_asset_creation_if_any(name)
+        if mempool_data:
             return mempool_data
         else:
-            saved_data = await self.db.lookup_asset_meta(name.encode('ascii'))
-            mempool_data = await self.mempool.get_asset_reissues_if_any(name)
-            if mempool_data and include_mempool:
+            saved_data = await self.db.lookup_asset_meta(name.encode())
+            mempool_data = include_mempool and await self.mempool.get_asset_reissues_if_any(name)
+            if mempool_data:
                 asset_data = {
                     'sats_in_circulation': saved_data['sats_in_circulation'] + mempool_data['sats_in_circulation'],
                     'divisions': mempool_data['divisions'] if mempool_data['divisions'] != 0xff else saved_data['divisions'],
@@ -1942,30 +2476,31 @@ class ElectrumX(SessionBase):
 
     async def get_assets_with_prefix(self, prefix: str):
         check_asset(prefix)
-        ret = await self.db.get_assets_with_prefix(prefix.encode('ascii'))
+        ret = await self.db.get_assets_with_prefix(prefix.encode())
         self.bump_cost(1.0 + len(ret) / 10)
         return ret
 
     async def get_messages(self, name):
         check_asset(name)
-        b_items = await self.db.lookup_messages(name.encode('ascii'))
+        name_b = name.encode()
+        b_items = await self.db.lookup_messages(name_b)
         self.bump_cost(1.0 + len(b_items) / 10)
-        m_items = await self.mempool.get_broadcasts(name.encode('ascii'))
+        m_items = await self.mempool.get_broadcasts(name_b)
         b_items.sort(key=lambda x: (x['height'], x['tx_hash']), reverse=True)
         return m_items + b_items
 
     async def is_qualified(self, h160: str, asset: str):
         check_asset(asset)
-        check_h160(h160)
+        h160_b = decode_h160(h160)
         self.bump_cost(1.0)
-        return await self.db.is_h160_qualified(bytes.fromhex(h160), asset.encode('ascii'))
+        return await self.db.is_h160_qualified(h160_b, asset.encode())
 
     async def qualifications_for_h160_history(self, h160: str, include_mempool=True):
-        check_h160(h160)
-        res = await self.db.qualifications_for_h160_history(bytes.fromhex(h160))
+        h160_b = decode_h160(h160)
+        res = await self.db.qualifications_for_h160_history(h160_b)
         self.bump_cost(2.0 + len(res) / 30)
         if include_mempool:
-            mem_res = await self.mempool.get_h160_tags(h160)
+            mem_res = await self.mempool.get_h160_tags(h160_b)
             if mem_res:
                 return res + [{
                     'asset': asset,
@@ -1977,8 +2512,10 @@ class ElectrumX(SessionBase):
         return res
 
     async def qualifications_for_h160(self, h160: str, include_mempool=True):
-        check_h160(h160)
-        res = await self.db.qualifications_for_h160(bytes.fromhex(h160))
+        return await self._qualifications_for_h160(decode_h160(h160), include_mempool)
+
+    async def _qualifications_for_h160(self, h160: bytes, include_mempool=True):
+        res = await self.db.qualifications_for_h160(h160)
         self.bump_cost(1.0 + len(res) / 10)
         if include_mempool:
             mem_res = await self.mempool.get_h160_tags(h160)
@@ -2038,7 +2575,7 @@ class ElectrumX(SessionBase):
             if mem_res:
                 return mem_res
         self.bump_cost(1.0)
-        return await self.db.is_restricted_frozen(asset.encode('ascii'))
+        return await self.db.is_restricted_frozen(asset.encode())
 
     async def get_restricted_string_history(self, asset: str, include_mempool=True):
         check_asset(asset)
@@ -2071,19 +2608,14 @@ class ElectrumX(SessionBase):
             if mem_res:
                 return mem_res
         self.bump_cost(1.0)
-        return await self.db.get_restricted_string(asset.encode('ascii'))
+        return await self.db.get_restricted_string(asset.encode())
 
     async def lookup_qualifier_associations_history(self, asset: str, include_mempool=True):
-        check_asset(asset)
-        if asset[0] != '#':
-            raise RPCError(
-                BAD_REQUEST, f'{asset} is not a qualifier'
-            ) from None
-        first_chunk = asset.split('/')[0]
-        res = await self.db.lookup_qualifier_associations_history(first_chunk.encode())
-        self.bump_cost(1.0 + len(res) / 30)
+        first_chunk_b = self._qualifier_first_chunk(asset)
+        res = await self.db.lookup_qualifier_associations_history(first_chunk_b)
         if include_mempool:
-            res_d = await self.lookup_qualifier_associations(asset)
+            res_d = await self._qualifier_associations(asset, first_chunk_b, True)
+            self.bump_cost(2.0 + len(res) / 30 + len(res_d) / 10)
             if res_d:
                 return res + [{
                     'asset': asset,
@@ -2093,23 +2625,36 @@ class ElectrumX(SessionBase):
                     'qualifying_tx_pos': mem_d['qualifying_tx_pos'],
                     'height': mem_d['height'],
                 } for asset, mem_d in res_d.items() if mem_d['height'] < 0]
+        else:
+            self.bump_cost(1.0 + len(res) / 30)
         return res
 
     async def lookup_qualifier_associations(self, asset: str, include_mempool=True):
+        first_chunk_b = self._qualifier_first_chunk(asset)
+        res = await self._qualifier_associations(asset, first_chunk_b, include_mempool)
+        self.bump_cost(1.0 + len(res) / 10)
+        return res
+
+    def _qualifier_first_chunk(self, asset):
+        '''Check asset is a qualifier and return its top-level qualifier as bytes.'''
         check_asset(asset)
         if asset[0] != '#':
             raise RPCError(
                 BAD_REQUEST, f'{asset} is not a qualifier'
             ) from None
-        first_chunk = asset.split('/')[0]
-        res = await self.db.lookup_qualifier_associations(first_chunk.encode())
-        self.bump_cost(1.0 + len(res) / 10)
+        return asset.split('/')[0].encode()
+
+    async def _qualifier_associations(self, asset, first_chunk_b, include_mempool):
+        '''The current restricted asset associations of a checked qualifier.  The mempool can
+        only add or disassociate assets, so the DB associations are needed either way.
+        The caller charges for the result.'''
+        res = await self.db.lookup_qualifier_associations(first_chunk_b)
         if include_mempool:
             for res_asset in list(res.keys()):
                 res_d = await self.mempool.restricted_verifier(res_asset)
                 if not res_d:
                     continue
-                if asset not in re.findall(r'([A-Z0-9_.]+)', res_d['string']):
+                if asset not in VERIFIER_ASSETS_RE.findall(res_d['string']):
                     res[res_asset] = {
                         'associated': False,
                         'height': -1,
@@ -2149,77 +2694,84 @@ class ElectrumX(SessionBase):
             'receive_count': self.recv_count
         }
 
-    def set_request_handlers(self, ptuple):
-        self.protocol_tuple = ptuple
-
-        handlers = {
-            'blockchain.block.header': self.block_header,
-            'blockchain.block.headers': self.block_headers,
-            'blockchain.estimatefee': self.estimatefee,
-            'blockchain.headers.subscribe': self.headers_subscribe,
-            'blockchain.relayfee': self.relayfee,
-            'blockchain.scripthash.get_balance': self.scripthash_get_balance,
-            'blockchain.scripthash.get_history': self.scripthash_get_history,
-            'blockchain.scripthash.get_mempool': self.scripthash_get_mempool,
-            'blockchain.scripthash.listunspent': self.scripthash_listunspent,
-            'blockchain.scripthash.subscribe': self.scripthash_subscribe,
-            'blockchain.transaction.broadcast': self.transaction_broadcast,
-            'blockchain.transaction.get': self.transaction_get,
-            'blockchain.transaction.get_merkle': self.transaction_merkle,
-            'blockchain.transaction.get_tsc_merkle': self.transaction_tsc_merkle,
-            'blockchain.transaction.id_from_pos': self.transaction_id_from_pos,
-            'mempool.get_fee_histogram': self.compact_fee_histogram,
-            'server.add_peer': self.add_peer,
-            'server.banner': self.banner,
-            'server.donation_address': self.donation_address,
-            'server.features': self.server_features_async,
-            'server.peers.subscribe': self.peers_subscribe,
-            'server.ping': self.ping,
-            'server.version': self.server_version,
-            'blockchain.scripthash.unsubscribe': self.scripthash_unsubscribe,
-            'blockchain.asset.subscribe': self.asset_subscribe,
-            'blockchain.asset.unsubscribe': self.asset_unsubscribe,
-            'blockchain.asset.check_tag': self.is_qualified,
-            'blockchain.asset.all_tags': self.qualifications_for_h160,
-            'blockchain.asset.is_frozen': self.is_restricted_frozen,
-            'blockchain.asset.validator_string': self.get_restricted_string,
-            'blockchain.asset.restricted_associations': self.lookup_qualifier_associations,
-            'blockchain.asset.broadcasts': self.get_messages,
-            'blockchain.asset.get_assets_with_prefix': self.get_assets_with_prefix,
-            'blockchain.asset.list_addresses_by_asset': self.list_addresses_by_asset,
-            'blockchain.asset.get_meta': self.asset_get_meta,
-
-            # 1.11
-            'blockchain.asset.verifier_string': self.get_restricted_string,
-            'blockchain.tag.check': self.is_qualified,
-            'blockchain.tag.qualifier.list': self.qualifications_for_qualifier,
-            'blockchain.tag.h160.list': self.qualifications_for_h160,
-            'blockchain.tag.qualifier.subscribe': self.subscribe_qualifier_tagging,
-            'blockchain.tag.qualifier.unsubscribe': self.unsubscribe_qualifier_tagging,
-            'blockchain.tag.h160.subscribe': self.subscribe_h160_tagged,
-            'blockchain.tag.h160.unsubscribe': self.unsubscribe_h160_tagged,
-            'blockchain.asset.broadcasts.subscribe': self.subscribe_broadcast,
-            'blockchain.asset.broadcasts.unsubscribe': self.unsubscribe_broadcast,
-            'blockchain.asset.is_frozen.subscribe': self.subscribe_asset_freeze,
-            'blockchain.asset.is_frozen.unsubscribe': self.unsubscribe_asset_freeze,
-            'blockchain.asset.verifier_string.subscribe': self.subscribe_restricted_verification_change,
-            'blockchain.asset.verifier_string.unsubscribe': self.unsubscribe_restricted_verification_change,
-            'blockchain.asset.restricted_associations.subscribe': self.subscribe_qualifier_associated_restricted,
-            'blockchain.asset.restricted_associations.unsubscribe': self.unsubscribe_qualifier_associated_restricted,
-
-            # 1.12
-            'blockchain.asset.get_meta_history': self.asset_get_meta_history,
-            'blockchain.asset.verifier_string_history': self.get_restricted_string_history,
-            'blockchain.tag.qualifier.history': self.qualifications_for_qualifier_history,
-            'blockchain.tag.h160.history': self.qualifications_for_h160_history,
-            'blockchain.asset.frozen_history': self.restricted_frozen_history,
-            'blockchain.asset.restricted_associations_history': self.lookup_qualifier_associations_history,
-
-            # Magic Node updates
-            'topic.update': self.handle_topic_update,
-        }
-
-        self.request_handlers = handlers
+    # JSON-RPC method name -> handler method name.  Shared by all sessions; the class's
+    # handlers table of functions is built from it.
+    HANDLER_NAMES = {
+        'blockchain.block.header': 'block_header',
+        'blockchain.block.headers': 'block_headers',
+        'blockchain.estimatefee': 'estimatefee',
+        'blockchain.headers.subscribe': 'headers_subscribe',
+        'blockchain.relayfee': 'relayfee',
+        'blockchain.scripthash.get_balance': 'scripthash_get_balance',
+        'blockchain.scripthash.get_history': 'scripthash_get_history',
+        'blockchain.scripthash.get_mempool': 'scripthash_get_mempool',
+        'blockchain.scripthash.listunspent': 'scripthash_listunspent',
+        'blockchain.scripthash.subscribe': 'scripthash_subscribe',
+        'blockchain.transaction.broadcast': 'transaction_broadcast',
+        'blockchain.transaction.get': 'transaction_get',
+        'blockchain.transaction.get_merkle': 'transaction_merkle',
+        'blockchain.transaction.get_tsc_merkle': 'transaction_tsc_merkle',
+        'blockchain.transaction.id_from_pos': 'transaction_id_from_pos',
+        'mempool.get_fee_histogram': 'compact_fee_histogram',
+        'server.add_peer': 'add_peer',
+        'server.banner': 'banner',
+        'server.donation_address': 'donation_address',
+        'server.features': 'server_features_async',
+        'server.peers.subscribe': 'peers_subscribe',
+        'server.ping': 'ping',
+        'server.version': 'server_version',
+        'blockchain.scripthash.unsubscribe': 'scripthash_unsubscribe',
+        'blockchain.asset.subscribe': 'asset_subscribe',
+        'blockchain.asset.unsubscribe': 'asset_unsubscribe',
+        'blockchain.asset.check_tag': 'is_qualified',
+        'blockchain.asset.all_tags': 'qualifications_for_h160',
+        'blockchain.asset.is_frozen': 'is_restricted_frozen',
+        'blockchain.asset.validator_string': 'get_restricted_string',
+        'blockchain.asset.restricted_associations': 'lookup_qualifier_associations',
+        'blockchain.asset.broadcasts': 'get_messages',
+        'blockchain.asset.get_assets_with_prefix': 'get_assets_with_prefix',
+        'blockchain.asset.list_addresses_by_asset': 'list_addresses_by_asset',
+        'blockchain.asset.get_meta': 'asset_get_meta',
+
+        # 1.11
+        'blockchain.tag.qualifier.list': 'qualifications_for_qualifier',
+        'blockchain.tag.qualifier.subscribe': 'subscribe_qualifier_tagging',
+        'blockchain.tag.qualifier.unsubscribe': 'unsubscribe_qualifier_tagging',
+        'blockchain.tag.h160.subscribe': 'subscribe_h160_tagged',
+        'blockchain.tag.h160.unsubscribe': 'unsubscribe_h160_tagged',
+        'blockchain.asset.broadcasts.subscribe': 'subscribe_broadcast',
+        'blockchain.asset.broadcasts.unsubscribe': 'unsubscribe_broadcast',
+        'blockchain.asset.is_frozen.subscribe': 'subscribe_asset_freeze',
+        'blockchain.asset.is_frozen.unsubscribe': 'unsubscribe_asset_freeze',
+        'blockchain.asset.verifier_string.subscribe': 'subscribe_restricted_verification_change',
+        'blockchain.asset.verifier_string.unsubscribe': 'unsubscribe_restricted_verification_change',
+        'blockchain.asset.restricted_associations.subscribe': 'subscribe_qualifier_associated_restricted',
+        'blockchain.asset.restricted_associations.unsubscribe': 'unsubscribe_qualifier_associated_restricted',
+
+        # 1.12
+        'blockchain.asset.get_meta_history': 'asset_get_meta_history',
+        'blockchain.asset.verifier_string_history': 'get_restricted_string_history',
+        'blockchain.tag.qualifier.history': 'qualifications_for_qualifier_history',
+        'blockchain.tag.h160.history': 'qualifications_for_h160_history',
+        'blockchain.asset.frozen_history': 'restricted_frozen_history',
+        'blockchain.asset.restricted_associations_history': 'lookup_qualifier_associations_history',
+        'blockchain.scripthashes.get_balance': 'scripthashes_get_balance',
+        'blockchain.scripthashes.get_history': 'scripthashes_get_history',
+        'blockchain.scripthashes.listunspent': 'scripthashes_listunspent',
+
+        # Magic Node updates
+        'topic.update': 'handle_topic_update',
+        'subscribe_topics': 'subscribe_topics',
+    }
+
+    # 1.11 names of methods that already existed under another name
+    HANDLER_ALIASES = {
+        'blockchain.asset.verifier_string': 'blockchain.asset.validator_string',
+        'blockchain.tag.check': 'blockchain.asset.check_tag',
+        'blockchain.tag.h160.list': 'blockchain.asset.all_tags',
+    }
+
+    HANDLER_NAMES = handler_table(HANDLER_NAMES, HANDLER_ALIASES)
 
 
 class LocalRPC(SessionBase):
@@ -2229,7 +2781,16 @@ class LocalRPC(SessionBase):
         super().__init__(*args, **kwargs)
         self.client = 'RPC'
         self.connection.max_response_size = 0
-        self.request_handlers = self.session_mgr.rpc_request_handlers
+
+    async def handle_request(self, request):
+        '''Handle an incoming request.  The handlers are the session manager's, already
+        bound to it.'''
+        if isinstance(request, Request):
+            handler = self.session_mgr.rpc_request_handlers.get(request.method)
+        else:
+            handler = None
+        self.method_counts['invalid method' if handler is None else request.method] += 1
+        return await cached_handler_invocation(handler, request)()
 
     def protocol_version_string(self):
         return 'RPC'
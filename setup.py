@@ -16,6 +16,7 @@ setuptools.setup(
     extras_require={
         'rocksdb': ['python-rocksdb>=0.6.9'],
         'uvloop': ['uvloop>=0.17'],
+        'orjson': ['orjson>=3.0'],
     },
     packages=setuptools.find_packages(include=('electrumx*',)),
     description='ElectrumX Server',
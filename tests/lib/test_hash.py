@@ -19,6 +19,11 @@ def test_double_sha256():
 def test_hash_to_hex_str():
     assert lib_hash.hash_to_hex_str(b'hash_to_str') == '7274735f6f745f68736168'
 
+def test_hashes_to_hex_strs():
+    hashes = [bytes(range(n, n + 32)) for n in range(3)]
+    assert lib_hash.hashes_to_hex_strs(hashes) == [lib_hash.hash_to_hex_str(h) for h in hashes]
+    assert lib_hash.hashes_to_hex_strs([]) == []
+
 def test_hex_str_to_hash():
     assert lib_hash.hex_str_to_hash('7274735f6f745f68736168') == b'hash_to_str'
 
@@ -62,6 +62,36 @@ def test_branch_and_root_from_proof():
             assert root == roots[n]
 
 
+def test_layers():
+    for n in range(len(hashes)):
+        layers = merkle.layers(b''.join(hashes[:n + 1]))
+        assert layers[0] == b''.join(hashes[:n + 1])
+        assert layers[-1] == roots[n]
+        assert len(layers) == merkle.tree_depth(n + 1)
+
+
+def test_layers_bad():
+    with pytest.raises(TypeError):
+        merkle.layers(hashes)
+    with pytest.raises(ValueError):
+        merkle.layers(b'')
+    with pytest.raises(ValueError):
+        merkle.layers(hashes[0] + b'1')
+
+
+def test_branch_and_root_from_layers():
+    for n in range(len(hashes)):
+        layers = merkle.layers(b''.join(hashes[:n + 1]))
+        for m in range(n + 1):
+            for tsc_format in (False, True):
+                assert (merkle.branch_and_root_from_layers(layers, m, tsc_format=tsc_format)
+                        == merkle.branch_and_root(hashes[:n + 1], m, tsc_format=tsc_format))
+    with pytest.raises(TypeError):
+        merkle.branch_and_root_from_layers(layers, 0.0)
+    with pytest.raises(ValueError):
+        merkle.branch_and_root_from_layers(layers, len(hashes))
+
+
 def test_branch_bad():
     with pytest.raises(TypeError):
         merkle.branch_and_root(0, 0)
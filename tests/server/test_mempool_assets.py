@@ -0,0 +1,108 @@
+from types import SimpleNamespace
+
+import pytest
+
+from electrumx.lib.coins import Evrmore
+from electrumx.server.mempool import MemPool, MemPoolAPI, MemPoolTx
+
+
+class API(MemPoolAPI):
+
+    async def height(self):
+        return 0
+
+    def cached_height(self):
+        return 0
+
+    def db_height(self):
+        return 0
+
+    async def mempool_hashes(self):
+        return []
+
+    async def raw_transactions(self, hex_hashes):
+        return []
+
+    async def lookup_utxos(self, prevouts):
+        return []
+
+    async def on_mempool(self, touched, height, assets,
+                         tag_qualifiers_touched, tag_h160_touched, broadcasts_asset_touched,
+                         freezes_asset_touched, verifier_string_asset_touched,
+                         restricted_qualifier_touched):
+        pass
+
+
+def asset_mempool():
+    '''A mempool holding one tx that created, reissued, tagged, broadcast, froze and set the
+    verifier of assets, as if the tx had been accepted.'''
+    mempool = MemPool(SimpleNamespace(coin=Evrmore), API())
+    tx_hash = bytes(32)
+    h160 = bytes(range(20))
+    mempool.txs[tx_hash] = MemPoolTx((), (), (), 0, 100)
+    mempool.asset_creates['NEW'] = {}
+    mempool.tx_to_asset_create[tx_hash].add('NEW')
+    mempool.asset_reissues['OLD'] = {}
+    mempool.tx_to_asset_reissue[tx_hash].add('OLD')
+    mempool.qualifier_tags['#QUAL'][tx_hash] = (h160, 1, True)
+    mempool.tx_to_qualifier_tags[tx_hash].add('#QUAL')
+    mempool.h160_tags[h160][tx_hash] = ('#QUAL', 1, True)
+    mempool.tx_to_h160_tags[tx_hash].add(h160)
+    mempool.broadcasts['MSG'][tx_hash] = (b'', None, 2)
+    mempool.tx_to_broadcast[tx_hash].add('MSG')
+    mempool.freezes['$RES'][tx_hash] = (3, True)
+    mempool.tx_to_freeze[tx_hash].add('$RES')
+    mempool.verifiers['$RES'][tx_hash] = (4, 5, '#QUAL')
+    mempool.tx_to_verifier[tx_hash].add('$RES')
+    mempool.qualifier_associations['#QUAL'][tx_hash] = (4, 5, '$RES')
+    mempool.tx_to_qualifier_associations[tx_hash].add('#QUAL')
+    return mempool, h160
+
+
+@pytest.mark.asyncio
+async def test_removed_tx_touches_its_assets():
+    # A tx leaving the mempool without being mined must touch everything it changed, so
+    # that cached statuses are invalidated and subscribers notified
+    mempool, h160 = asset_mempool()
+    touched_sets = [set() for _ in range(7)]
+    await mempool._process_mempool(set(), set(), *touched_sets, 0)
+
+    assert touched_sets == [{'NEW', 'OLD'}, {'#QUAL'}, {h160}, {'MSG'}, {'$RES'}, {'$RES'},
+                            {'#QUAL'}]
+    assert not mempool.txs
+    assert not mempool.asset_creates
+    assert not mempool.asset_reissues
+    assert not mempool.qualifier_tags
+    assert not mempool.h160_tags
+
+
+def pairs_mempool():
+    '''A mempool holding one tx of mixed asset inputs and outputs of one hashX.'''
+    mempool = MemPool(SimpleNamespace(coin=Evrmore), API())
+    tx_hash = bytes(32)
+    hashX = bytes(range(11))
+    in_pairs = ((hashX, 2, 'FOO'), )
+    out_pairs = ((hashX, 5, None), (hashX, 7, 'FOO'), (hashX, 11, 'FOOBAR'), (hashX, 13, 'O'))
+    mempool.txs[tx_hash] = MemPoolTx((), in_pairs, out_pairs, 0, 100)
+    mempool.hashXs[hashX].add(tx_hash)
+    return mempool, hashX
+
+
+@pytest.mark.asyncio
+async def test_balance_delta_asset_filter():
+    mempool, hashX = pairs_mempool()
+    assert await mempool.balance_delta(hashX, False) == {None: 5}
+    assert await mempool.balance_delta(hashX, 'FOO') == {'FOO': 5}
+    assert await mempool.balance_delta(hashX, 'FOOBAR') == {'FOOBAR': 11}
+    assert await mempool.balance_delta(hashX, ['O', None]) == {None: 5, 'O': 13}
+    assert await mempool.balance_delta(hashX, True) == {None: 5, 'FOO': 5, 'FOOBAR': 11,
+                                                        'O': 13}
+
+
+@pytest.mark.asyncio
+async def test_unordered_UTXOs_asset_filter():
+    mempool, hashX = pairs_mempool()
+    utxos = await mempool.unordered_UTXOs(hashX, 'FOO')
+    assert [(utxo.name, utxo.value) for utxo in utxos] == [('FOO', 7)]
+    utxos = await mempool.unordered_UTXOs(hashX, False)
+    assert [(utxo.name, utxo.value) for utxo in utxos] == [(None, 5)]
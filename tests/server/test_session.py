@@ -0,0 +1,209 @@
+import hashlib
+import logging
+import os
+from collections import defaultdict
+from types import SimpleNamespace
+
+import pylru
+import pytest
+from aiorpcx import NewlineFramer
+
+from electrumx.lib.hash import hash_to_hex_str
+
+from electrumx.server.session import (ASSET_SUB_KINDS, BufferedNewlineFramer, ElectrumX,
+                                      SessionManager)
+
+
+class MockSessionManager(SessionManager):
+    def __init__(self):  # forego complexities of initialization
+        self.logger = logging.getLogger("mock-session-manager")
+        self.sessions = {}
+        self.notified_height = 100
+        self._history_cache = pylru.lrucache(1000)
+        self._status_cache = pylru.lrucache(1000)
+        self._reorg_count = 0
+        self._shared_status_cache = pylru.lrucache(10000)
+        self._sub_indices = {kind: defaultdict(set) for kind in ASSET_SUB_KINDS}
+
+
+def no_touches():
+    return [set() for _kind in ASSET_SUB_KINDS]
+
+
+@pytest.mark.asyncio
+async def test_shared_status_recalculated_after_mempool_eviction():
+    session_mgr = MockSessionManager()
+    calculations = []
+
+    async def asset_status(asset):
+        calculations.append(asset)
+        return f'status {len(calculations)}'
+
+    assert await session_mgr.shared_status('asset_subs', 'FOO', asset_status) == \
+        ('status 1', False)
+    assert await session_mgr.shared_status('asset_subs', 'FOO', asset_status) == \
+        ('status 1', True)
+
+    # The mempool tx that created FOO is evicted; the mempool touches FOO
+    touches = no_touches()
+    touches[0].add('FOO')
+    await session_mgr._notify_sessions(100, set(), *touches)
+
+    # The next subscription calculates the status afresh
+    assert await session_mgr.shared_status('asset_subs', 'FOO', asset_status) == \
+        ('status 2', False)
+    assert calculations == ['FOO', 'FOO']
+
+
+class MockElectrumX(ElectrumX):
+    def __init__(self):  # forego complexities of initialization
+        self.session_mgr = MockSessionManager()
+        self.costs = []
+
+    def bump_cost(self, cost):
+        self.costs.append(cost)
+
+
+def balance_session(utxo_counts):
+    session = MockElectrumX()
+
+    async def all_utxos(hashX, asset):
+        return [SimpleNamespace(name=None, value=1)] * utxo_counts[hashX]
+
+    async def balance_delta(hashX, asset):
+        return {None: 2}
+
+    session.db = SimpleNamespace(all_utxos=all_utxos)
+    session.mempool = SimpleNamespace(balance_delta=balance_delta)
+    return session
+
+
+@pytest.mark.asyncio
+async def test_get_balance_cost():
+    session = balance_session({b'a': 100})
+    assert await session.get_balance(b'a', False) == {'confirmed': 100, 'unconfirmed': 2}
+    assert session.costs == [3.0]
+
+
+@pytest.mark.asyncio
+async def test_scripthashes_get_balance_cost():
+    # The batch is charged before any lookup, and in total the same as single lookups
+    utxo_counts = {bytes([n]) * 11: n * 50 for n in range(1, 4)}
+    session = balance_session(utxo_counts)
+    session.scripthashes_to_hashXs = lambda scripthashes: list(utxo_counts)
+    result = await session.scripthashes_get_balance(['a', 'b', 'c'])
+    assert result == [{'confirmed': count, 'unconfirmed': 2} for count in utxo_counts.values()]
+    assert session.costs[0] == 3.0
+    assert sum(session.costs) == pytest.approx(2 + 3 + 4)
+
+
+@pytest.mark.asyncio
+async def test_scripthashes_get_history_cost():
+    # Each history's base cost is charged once, not again for the batch
+    session = MockElectrumX()
+
+    async def limited_history(hashX):
+        return [(bytes(32), 5)], 0.2
+
+    async def transaction_summaries(hashX):
+        return []
+
+    session.session_mgr.limited_history = limited_history
+    session.mempool = SimpleNamespace(transaction_summaries=transaction_summaries)
+    single = await session.confirmed_and_unconfirmed_history(b'a')
+    assert single == [{'tx_hash': '00' * 32, 'height': 5}]
+    single_cost = sum(session.costs)
+
+    session.costs.clear()
+    session.scripthashes_to_hashXs = lambda scripthashes: [b'a', b'b']
+    assert await session.scripthashes_get_history(['a', 'b']) == [single, single]
+    assert sum(session.costs) == pytest.approx(2 * single_cost)
+
+
+async def framed_messages(framer, chunks, count):
+    for chunk in chunks:
+        framer.received_bytes(chunk)
+    return [await framer.receive_message() for _ in range(count)]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("framer_class", [NewlineFramer, BufferedNewlineFramer])
+async def test_framer_split_message(framer_class):
+    framer = framer_class()
+    chunks = [b'{"id": 1, ', b'"method": ', b'"server.ping"}\n']
+    assert await framed_messages(framer, chunks, 1) == [b'{"id": 1, "method": "server.ping"}']
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("framer_class", [NewlineFramer, BufferedNewlineFramer])
+async def test_framer_several_messages_per_chunk(framer_class):
+    framer = framer_class()
+    chunks = [b'one\ntwo\n\nthr', b'ee\nfour\nfi', b've\n']
+    assert await framed_messages(framer, chunks, 6) == [b'one', b'two', b'', b'three',
+                                                         b'four', b'five']
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("framer_class", [NewlineFramer, BufferedNewlineFramer])
+async def test_framer_oversized_message(framer_class):
+    framer = framer_class(max_size=10)
+    for chunk in (b'small\n' + b'x' * 8, b'x' * 8, b'xx\nnext\nlast', b'\n'):
+        framer.received_bytes(chunk)
+    assert await framer.receive_message() == b'small'
+    with pytest.raises(MemoryError) as e:
+        await framer.receive_message()
+    assert str(e.value) == 'dropping message over 10 bytes and re-synchronizing'
+    # The rest of the oversized message is dropped up to the next newline
+    assert await framer.receive_message() == b'next'
+    assert await framer.receive_message() == b'last'
+
+
+def full_status(history):
+    status = ''.join(f'{hash_to_hex_str(tx_hash)}:{height:d}:' for tx_hash, height in history)
+    return hashlib.sha256(status.encode()).hexdigest()
+
+
+def random_history(count, start_height=1):
+    return [(os.urandom(32), height) for height in range(start_height, start_height + count)]
+
+
+def hasher_status(session_mgr, hashX, history, reorg_count=None):
+    if reorg_count is None:
+        reorg_count = session_mgr._reorg_count
+    hasher, length = session_mgr.confirmed_status_hasher(hashX, history, reorg_count)
+    return hasher.hexdigest()
+
+
+def test_confirmed_status_hasher_extended_history():
+    session_mgr = MockSessionManager()
+    hashX = bytes(11)
+    history = random_history(5)
+    assert hasher_status(session_mgr, hashX, history) == full_status(history)
+    # Only the new entries are hashed, on top of the cached state
+    history += random_history(3, 10)
+    assert hasher_status(session_mgr, hashX, history) == full_status(history)
+    assert session_mgr._status_cache[hashX][0] == 8
+    # Unchanged history
+    assert hasher_status(session_mgr, hashX, history) == full_status(history)
+
+
+def test_confirmed_status_hasher_reorg():
+    session_mgr = MockSessionManager()
+    hashX = bytes(11)
+    history = random_history(5)
+    assert hasher_status(session_mgr, hashX, history) == full_status(history)
+
+    # A reorg replaces an interior entry but leaves the last entry matching
+    session_mgr._reorg_count += 1
+    reorged = history[:2] + random_history(1, 3) + history[3:]
+    assert hasher_status(session_mgr, hashX, reorged) == full_status(reorged)
+
+    # A history read before another reorg is not cached after it
+    stale_reorg_count = session_mgr._reorg_count
+    session_mgr._reorg_count += 1
+    assert hasher_status(session_mgr, hashX, history, stale_reorg_count) == \
+        full_status(history)
+    # The cached state is still that of the reorged history
+    assert session_mgr._status_cache[hashX][3].hexdigest() == full_status(reorged)
+    truncated = reorged[:3]
+    assert hasher_status(session_mgr, hashX, truncated) == full_status(truncated)